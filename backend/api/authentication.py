@@ -0,0 +1,121 @@
+import hashlib
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_KEY_PREFIX = 'auth-token'
+
+
+class TokenCache:
+    """LRU-кэш токенов в памяти процесса с ограниченным временем жизни.
+
+    За локальным кэшем может стоять общий кэш Django (`shared_cache`).
+    Сигналы из `api.signals` удаляют записи при выходе, смене пароля,
+    деактивации пользователя и удалении токена; в других процессах
+    локальная запись живет не дольше `timeout` секунд.
+    """
+
+    def __init__(self, max_size, timeout, shared_cache=None,
+                 shared_timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.shared_cache = shared_cache
+        self.shared_timeout = shared_timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        if self.shared_cache:
+            return caches[self.shared_cache]
+        return None
+
+    @staticmethod
+    def shared_key(key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f'{TOKEN_CACHE_KEY_PREFIX}:{digest}'
+
+    def store_local(self, key, data):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        """Пара (user, token) или None; объекты каждый раз новые."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(entry[1])
+            self.entries.pop(key, None)
+        if self.shared is not None:
+            data = self.shared.get(self.shared_key(key))
+            if data is not None:
+                self.store_local(key, data)
+                with self.lock:
+                    self.shared_hits += 1
+                return pickle.loads(data)
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, user, token):
+        data = pickle.dumps((user, token))
+        self.store_local(key, data)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), data, self.shared_timeout)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.shared is not None and keys:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Счетчики попаданий для мониторинга."""
+        with self.lock:
+            total = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (
+                    (self.hits + self.shared_hits) / total if total else 0.0)
+            }
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    timeout=settings.TOKEN_CACHE_TIMEOUT,
+    shared_cache=settings.TOKEN_CACHE_SHARED_ALIAS,
+    shared_timeout=settings.TOKEN_CACHE_SHARED_TIMEOUT
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для известных токенов."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+from .models import DataVersion
+
+VERSION_KEY_PREFIX = 'version'
+INITIAL_VERSION = 'initial'
+VERSION_MEMO_SIZE = 10000
+
+
+def versions_in_db():
+    """Кэш в памяти процесса не виден другим воркерам.
+
+    В этом случае версии хранятся в таблице DataVersion, а в кэше
+    остаются только данные, ключи которых включают версию. Строка
+    таблицы появляется при первом изменении набора данных.
+    """
+    return isinstance(caches['default'], LocMemCache)
+
+
+class VersionMemo:
+    """Версии из DataVersion, прочитанные процессом за последние
+    DATA_VERSION_MEMO_TIMEOUT секунд.
+
+    Изменение в этом процессе видно сразу, изменение в другом
+    воркере - не позже чем через DATA_VERSION_MEMO_TIMEOUT секунд.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get_many(self, names):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                name: entry[1] for name, entry in (
+                    (name, self.entries.get(name)) for name in names)
+                if entry is not None and entry[0] > now
+            }
+
+    def set(self, name, version):
+        with self.lock:
+            self.entries[name] = (
+                time.monotonic() + settings.DATA_VERSION_MEMO_TIMEOUT,
+                version
+            )
+            self.entries.move_to_end(name)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+version_memo = VersionMemo(VERSION_MEMO_SIZE)
+
+
+def get_versions(*names):
+    """Текущие версии наборов данных одним обращением к хранилищу."""
+    if versions_in_db():
+        versions = version_memo.get_many(names)
+        missing = [name for name in names if name not in versions]
+        if missing:
+            stored = dict(DataVersion.objects.filter(
+                name__in=missing).values_list('name', 'version'))
+            for name in missing:
+                versions[name] = stored.get(name, INITIAL_VERSION)
+                version_memo.set(name, versions[name])
+        return [versions[name] for name in names]
+    keys = {f'{VERSION_KEY_PREFIX}:{name}': name for name in names}
+    versions = {keys[key]: version
+                for key, version in cache.get_many(keys).items()}
+    for key, name in keys.items():
+        if name not in versions:
+            version = uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[name] = version
+    return [versions[name] for name in names]
+
+
+def get_version(name):
+    """Текущая версия набора данных (создается при первом обращении)."""
+    return get_versions(name)[0]
+
+
+def store_version(name, version):
+    """Записывает версию в DataVersion одним UPSERT, где он доступен."""
+    if connection.vendor in ('postgresql', 'sqlite'):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} (name, version) VALUES (%s, %s) '
+                'ON CONFLICT (name) DO UPDATE SET version = excluded.version'
+                .format(connection.ops.quote_name(
+                    DataVersion._meta.db_table)),
+                [name, version]
+            )
+        return
+    versions = DataVersion.objects.filter(name=name)
+    if not versions.update(version=version):
+        DataVersion.objects.bulk_create(
+            [DataVersion(name=name, version=version)], ignore_conflicts=True)
+        versions.update(version=version)
+
+
+def bump_version(name):
+    """Новая версия делает недействительными все ключи старой версии."""
+    version = uuid4().hex
+    if versions_in_db():
+        store_version(name, version)
+        version_memo.set(name, version)
+        return version
+    cache.set(f'{VERSION_KEY_PREFIX}:{name}', version, None)
+    return version
@@ -0,0 +1,97 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .cache import get_version
+
+RECIPES_COUNT_VERSION = 'recipes-count'
+EXACT_COUNT = 'exact'
+CACHED_COUNT = 'cached'
+ESTIMATED_COUNT = 'estimated'
+
+
+def user_count_version(user_id):
+    """Версия количеств, зависящих от избранного и корзины пользователя."""
+    return f'{RECIPES_COUNT_VERSION}:{user_id}'
+
+
+class ExactCountStrategy:
+    """Точный COUNT(*) на каждый запрос."""
+
+    def count(self, queryset, request):
+        return queryset.count(), EXACT_COUNT
+
+
+class AdaptiveCountStrategy(ExactCountStrategy):
+    """Точное количество для небольших выборок, кэш для средних
+    и оценка планировщика PostgreSQL для больших.
+
+    Ключ кэша строится из нормализованных параметров фильтрации;
+    версия ключа меняется при записи рецептов (см. `api.signals`).
+    """
+    exact_threshold = 1000
+    estimate_threshold = 100000
+    cache_timeout = 60
+    ignored_params = ('page', 'limit', 'cursor', 'count', 'ordering')
+    user_dependent_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_cache_key(self, request):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+            if key not in self.ignored_params
+        )
+        scope = [RECIPES_COUNT_VERSION, get_version(RECIPES_COUNT_VERSION)]
+        if (request.user.is_authenticated
+                and any(key in self.user_dependent_params
+                        for key, _ in params)):
+            scope += [str(request.user.pk),
+                      get_version(user_count_version(request.user.pk))]
+        digest = hashlib.md5(
+            repr((request.path, params)).encode()).hexdigest()
+        return ':'.join(scope + [digest])
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def count(self, queryset, request):
+        cache_key = self.get_cache_key(request)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, CACHED_COUNT
+        bounded = queryset[:self.exact_threshold + 1].count()
+        if bounded <= self.exact_threshold:
+            return bounded, EXACT_COUNT
+        estimated = self.estimate(queryset)
+        if estimated is not None and estimated > self.estimate_threshold:
+            return estimated, ESTIMATED_COUNT
+        value = queryset.count()
+        cache.set(cache_key, value, self.cache_timeout)
+        return value, EXACT_COUNT
+
+
+class CountStrategyPaginator(Paginator):
+    """Paginator, получающий количество объектов от стратегии подсчета."""
+
+    def __init__(self, object_list, per_page, count_strategy=None,
+                 request=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy or ExactCountStrategy()
+        self.request = request
+        self.count_type = None
+
+    @cached_property
+    def count(self):
+        value, self.count_type = self.count_strategy.count(
+            self.object_list, self.request)
+        return value
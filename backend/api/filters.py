@@ -1,21 +1,25 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, Tag
+from recipes.search import filter_recipes
 
-
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-id'),
+}
 
 
 class RecipeFilter(FilterSet):
+    """Фильтры списка рецептов.
+
+    `search` упорядочивает результат по релевантности; явный `ordering`
+    заменяет этот порядок, релевантность тогда не учитывается.
+    """
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='tags_filter'
     )
     is_favorited = filters.BooleanFilter(
         method='is_favorited_filter'
@@ -23,6 +27,13 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(
+        method='search_filter'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='ordering_filter'
+    )
 
     class Meta:
         model = Recipe
@@ -31,6 +42,11 @@ class RecipeFilter(FilterSet):
             'author'
         )
 
+    def tags_filter(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(tag_ids__overlap=[tag.id for tag in value])
+
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
@@ -42,3 +58,9 @@ class RecipeFilter(FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(recipes_shoppingcart_related__user=user)
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        return filter_recipes(queryset, value)
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,179 @@
+import re
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from functools import partial
+from heapq import nlargest
+from threading import Lock
+
+from django.conf import settings
+from django.db.models import Count
+
+from recipes.models import Ingredient, RecipeIngredients
+from .cache import get_version
+
+INGREDIENTS_VERSION = 'ingredients'
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+MIN_FUZZY_QUERY_LENGTH = 3
+WORD_RE = re.compile(r'\w+')
+
+IndexData = namedtuple(
+    'IndexData',
+    ('rows', 'keys', 'usage', 'word_suffixes', 'trigrams')
+)
+
+
+def usage_epoch():
+    """Номер интервала, в течение которого не обновляется популярность."""
+    return int(time.time() // settings.INGREDIENT_USAGE_REFRESH_INTERVAL)
+
+
+def trigrams(text):
+    """Триграммы слов, как в pg_trgm: '  слово ' -> '  с', ' сл', ..."""
+    result = set()
+    for word in WORD_RE.findall(text.casefold()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Загружается при первом обращении и перестраивается, когда меняется
+    версия данных `INGREDIENTS_VERSION` в кэше или истекает интервал
+    INGREDIENT_USAGE_REFRESH_INTERVAL, за который копится изменение
+    популярности ингредиентов. Если версию не передал вызывающий код
+    (представление читает ее для ключа кэша), она проверяется не чаще
+    раза в INGREDIENT_INDEX_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.checked_at = 0
+        self.data = IndexData((), (), (), (), ())
+        self.rows_by_id = ()
+        self.lock = Lock()
+
+    def ensure_loaded(self, data_version=None):
+        """data_version - уже прочитанная версия INGREDIENTS_VERSION."""
+        now = time.monotonic()
+        if data_version is None:
+            if (self.version is not None
+                    and self.version[1] == usage_epoch()
+                    and now - self.checked_at
+                    < settings.INGREDIENT_INDEX_CHECK_INTERVAL):
+                return
+            data_version = get_version(INGREDIENTS_VERSION)
+        self.checked_at = now
+        version = (data_version, usage_epoch())
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            rows = sorted(
+                Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'),
+                key=lambda row: (row[1].casefold(), row[0])
+            )
+            usage = dict(
+                RecipeIngredients.objects.order_by().values(
+                    'ingredient'
+                ).annotate(count=Count('id')).values_list(
+                    'ingredient', 'count')
+            )
+            keys = tuple(row[1].casefold() for row in rows)
+            self.data = IndexData(
+                rows=tuple(rows),
+                keys=keys,
+                usage=tuple(usage.get(row[0], 0) for row in rows),
+                word_suffixes=tuple(sorted(
+                    (key[match.start():], position)
+                    for position, key in enumerate(keys)
+                    for match in WORD_RE.finditer(key) if match.start()
+                )),
+                trigrams=tuple(trigrams(key) for key in keys)
+            )
+            self.rows_by_id = tuple(sorted(rows))
+            self.version = version
+
+    @staticmethod
+    def as_dict(row):
+        return {'id': row[0], 'name': row[1], 'measurement_unit': row[2]}
+
+    def all(self, data_version=None):
+        self.ensure_loaded(data_version)
+        return [self.as_dict(row) for row in self.rows_by_id]
+
+    @staticmethod
+    def prefix_matches(data, query):
+        position = bisect_left(data.keys, query)
+        while (position < len(data.keys)
+               and data.keys[position].startswith(query)):
+            yield position
+            position += 1
+
+    @staticmethod
+    def word_prefix_matches(data, query):
+        index = bisect_left(data.word_suffixes, (query,))
+        while (index < len(data.word_suffixes)
+               and data.word_suffixes[index][0].startswith(query)):
+            yield data.word_suffixes[index][1]
+            index += 1
+
+    @staticmethod
+    def substring_matches(data, query):
+        return (position for position, key in enumerate(data.keys)
+                if query in key)
+
+    @staticmethod
+    def similar(data, query, limit):
+        """Самые похожие по триграммам названия, не более limit.
+
+        Сходство считается в памяти, как similarity() в pg_trgm, с тем же
+        порогом по умолчанию, поэтому автодополнение не обращается к БД.
+        """
+        if len(query) < MIN_FUZZY_QUERY_LENGTH:
+            return []
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        scored = []
+        for position, name_trigrams in enumerate(data.trigrams):
+            similarity = (len(query_trigrams & name_trigrams)
+                          / len(query_trigrams | name_trigrams))
+            if similarity >= TRIGRAM_SIMILARITY_THRESHOLD:
+                scored.append((similarity, -position))
+        return [-position for _, position in nlargest(limit, scored)]
+
+    def search(self, query, limit=None, data_version=None):
+        """Не более limit ингредиентов, подходящих под запрос.
+
+        Сначала идут совпадения с началом названия, затем с началом
+        слова в названии, затем по подстроке и, наконец, похожие по
+        триграммам (опечатки). Внутри группы ингредиенты упорядочены
+        по числу рецептов, в которых они используются.
+        """
+        self.ensure_loaded(data_version)
+        data = self.data
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        query = query.casefold().strip()
+        result = []
+        seen = set()
+        for matches in (self.prefix_matches, self.word_prefix_matches,
+                        self.substring_matches,
+                        partial(self.similar, limit=limit)):
+            if not query or len(result) >= limit:
+                break
+            positions = sorted(
+                set(matches(data, query)) - seen,
+                key=lambda position: (-data.usage[position], position)
+            )[:limit - len(result)]
+            seen.update(positions)
+            result += positions
+        return [self.as_dict(data.rows[position]) for position in result]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_version
+
+TAGS_VERSION = 'tags'
+
+
+class VersionedCacheMixin:
+    """Кэширование справочных данных по версии набора данных.
+
+    В кэше под ключом, включающим версию `cache_version_name` и формат
+    ответа, хранится уже отрендеренное тело ответа; оно отдается со
+    строгим ETag. На запрос с совпадающим If-None-Match возвращается 304
+    без выборки данных. Ответы для браузера (BrowsableAPIRenderer)
+    не кэшируются.
+    """
+    cache_version_name = None
+    data_version = None
+
+    def perform_authentication(self, request):
+        """Справочники доступны всем, пользователь определяется лениво."""
+
+    def get_cache_key(self, request):
+        version = self.data_version = get_version(self.cache_version_name)
+        digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return (f'{self.cache_version_name}:{version}:'
+                f'{request.accepted_renderer.format}:{digest}')
+
+    def render(self, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        return response.render()
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if request.accepted_renderer.media_type == 'text/html':
+            return handler(request, *args, **kwargs)
+        cache_key = self.get_cache_key(request)
+        etag = quote_etag(hashlib.md5(cache_key.encode()).hexdigest())
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cached = cache.get(cache_key)
+            if cached is None:
+                response = self.render(
+                    request, handler(request, *args, **kwargs))
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(cache_key,
+                          (response.content, response['Content-Type']),
+                          settings.REFERENCE_DATA_CACHE_TIMEOUT)
+            else:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.REFERENCE_DATA_MAX_AGE
+        )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class DataVersion(models.Model):
+    """Версия набора данных для кэша в памяти процесса (см. api.cache)."""
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Набор данных'
+    )
+    version = models.CharField(
+        max_length=32,
+        verbose_name='Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
@@ -1,8 +1,79 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+from functools import partial
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from .counts import CountStrategyPaginator
 
 CUSTOM_PAGINATION_PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
+
+
+class CustomCursorPagination(CursorPagination):
+    """Постраничный вывод по курсору (keyset) без OFFSET и COUNT(*).
+
+    Общее количество объектов возвращается только по запросу
+    параметром `count=true`.
+    """
+    page_size = CUSTOM_PAGINATION_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    count_query_param = 'count'
+    ordering = ('-id',)
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+                'true', 'True', '1'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response_data = OrderedDict()
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['next'] = self.get_next_link()
+        response_data['previous'] = self.get_previous_link()
+        response_data['results'] = data
+        return Response(response_data)
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничный вывод по номеру страницы.
+
+    Если у представления задан `cursor_ordering`, то наличие в запросе
+    параметра `cursor` (в том числе пустого) включает вывод по курсору.
+    Количество объектов считает `count_strategy` представления, вид
+    подсчета возвращается в заголовке `X-Total-Count-Type`.
+    """
     page_size = CUSTOM_PAGINATION_PAGE_SIZE
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = CustomCursorPagination.cursor_query_param
+    cursor_paginator = None
+    count_type_header = 'X-Total-Count-Type'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_ordering = getattr(view, 'cursor_ordering', None)
+        if cursor_ordering and self.cursor_query_param in request.query_params:
+            self.cursor_paginator = CustomCursorPagination(cursor_ordering)
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        self.django_paginator_class = partial(
+            CountStrategyPaginator,
+            count_strategy=getattr(view, 'count_strategy', None),
+            request=request
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response[self.count_type_header] = self.page.paginator.count_type
+        return response
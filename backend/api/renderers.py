@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+import zlib
+from itertools import chain, islice
+
+import orjson
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+SHOPPING_LIST_TITLE = 'Cписок покупок:'
+SHOPPING_LISTS_VERSION = 'shopping-lists'
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def shopping_list_version(user_id):
+    """Версия списка покупок пользователя для ETag выгрузки."""
+    return f'{SHOPPING_LISTS_VERSION}:{user_id}'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON через orjson.
+
+    Вывод совпадает с JSONRenderer при настройках DRF по умолчанию:
+    компактный, без экранирования не-ASCII символов, даты форматирует
+    кодировщик DRF. Ответы с отступами и режим FAST_READ_PATH=False
+    обрабатывает стандартный рендерер.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (not settings.FAST_READ_PATH or data is None or self.get_indent(
+                accepted_media_type, renderer_context or {})):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data, default=self.encoder_class().default,
+            option=ORJSON_OPTIONS
+        ).replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый формат выгрузки списка покупок.
+
+    `render` используется только для ответов с ошибками, сам список
+    отдается потоком из `stream`.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    def stream(self, items):
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        yield SHOPPING_LIST_TITLE
+        for item in items:
+            yield '\n{} - {} {}.'.format(*item)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'amount', 'measurement_unit'))
+        for item in items:
+            writer.writerow(item)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, items):
+        yield '['
+        separator = ''
+        for name, amount, measurement_unit in items:
+            yield separator + json.dumps(
+                {'name': name,
+                 'amount': amount,
+                 'measurement_unit': measurement_unit},
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']'
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """Печатная версия: страницы A4 рисуются средствами Pillow.
+
+    Документ собирается потоком: каждая страница рисуется, сжимается
+    и отдается клиенту отдельно, в памяти одновременно находится только
+    одна страница. Дерево страниц и таблица xref пишутся в конце.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    page_size = (827, 1169)
+    resolution = 100
+    margin = 60
+    line_height = 28
+
+    def get_font(self):
+        try:
+            return ImageFont.truetype(settings.SHOPPING_LIST_PDF_FONT, 18)
+        except OSError:
+            return ImageFont.load_default()
+
+    def pages(self, items):
+        font = self.get_font()
+        lines = chain([SHOPPING_LIST_TITLE], (
+            '{} - {} {}.'.format(*item) for item in items))
+        per_page = (
+            (self.page_size[1] - 2 * self.margin) // self.line_height)
+        while True:
+            page_lines = list(islice(lines, per_page))
+            if not page_lines:
+                return
+            page = Image.new('L', self.page_size, 'white')
+            draw = ImageDraw.Draw(page)
+            for number, line in enumerate(page_lines):
+                draw.text(
+                    (self.margin, self.margin + number * self.line_height),
+                    line, fill='black', font=font
+                )
+            yield page
+
+    @staticmethod
+    def pdf_object(number, dictionary, data=None):
+        body = b'%d 0 obj\n%s' % (number, dictionary)
+        if data is not None:
+            body += b'\nstream\n%s\nendstream' % data
+        return body + b'\nendobj\n'
+
+    def stream(self, items):
+        width, height = (b'%.2f' % (size * 72 / self.resolution)
+                         for size in self.page_size)
+        offsets = {}
+        position = 0
+
+        def write(chunk, number=None):
+            nonlocal position
+            if number is not None:
+                offsets[number] = position
+            position += len(chunk)
+            return chunk
+
+        yield write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        # 1 - каталог, 2 - дерево страниц, затем по три объекта
+        # на страницу: изображение, содержимое и сама страница.
+        kids = []
+        number = 3
+        for page in self.pages(items):
+            data = zlib.compress(page.tobytes())
+            yield write(self.pdf_object(
+                number,
+                b'<< /Type /XObject /Subtype /Image /Width %d /Height %d '
+                b'/ColorSpace /DeviceGray /BitsPerComponent 8 '
+                b'/Filter /FlateDecode /Length %d >>'
+                % (*self.page_size, len(data)),
+                data
+            ), number)
+            content = b'q %s 0 0 %s 0 0 cm /Page Do Q' % (width, height)
+            yield write(self.pdf_object(
+                number + 1, b'<< /Length %d >>' % len(content), content
+            ), number + 1)
+            yield write(self.pdf_object(
+                number + 2,
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] '
+                b'/Resources << /XObject << /Page %d 0 R >> >> '
+                b'/Contents %d 0 R >>' % (width, height, number, number + 1)
+            ), number + 2)
+            kids.append(number + 2)
+            number += 3
+        yield write(self.pdf_object(
+            2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+        ), 2)
+        yield write(self.pdf_object(
+            1, b'<< /Type /Catalog /Pages 2 0 R >>'), 1)
+        yield (
+            b'xref\n0 %d\n0000000000 65535 f \n' % number
+            + b''.join(b'%010d 00000 n \n' % offsets[object_number]
+                       for object_number in range(1, number))
+            + b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n'
+            % (number, position)
+        )
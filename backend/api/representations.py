@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from recipes.models import Recipe, RecipeIngredients, RecipeTags
+from .utils import author_recipes, image_size_urls
+
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+RECIPE_VALUES = (
+    'id', 'name', 'image', 'image_sizes', 'text', 'cooking_time',
+    'pub_date', 'favorites_count', 'is_favorited', 'is_in_shopping_cart',
+    'author_is_subscribed',
+    *(f'author__{field}' for field in USER_FIELDS),
+)
+SUBSCRIPTION_VALUES = (*USER_FIELDS, 'is_subscribed', 'recipes_count')
+IMAGE_STORAGE = Recipe._meta.get_field('image').storage
+
+
+def recipe_values(queryset):
+    """Словари рецептов из queryset представления.
+
+    pub_date и favorites_count нужны только для курсорной пагинации.
+    """
+    return queryset.prefetch_related(None).values(*RECIPE_VALUES)
+
+
+def image_url(name, request):
+    if not name:
+        return None
+    url = IMAGE_STORAGE.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_sizes(name, sizes, request):
+    if not name:
+        return None
+    return image_size_urls(IMAGE_STORAGE, name, sizes, request)
+
+
+def recipes(rows, request):
+    """Рецепты в формате RecipeReadSerializer.
+
+    Теги и ингредиенты всех рецептов читаются двумя запросами
+    values_list, поля автора приходят в строках рецептов.
+    """
+    recipe_ids = [row['id'] for row in rows]
+    if not recipe_ids:
+        return []
+    tags = defaultdict(list)
+    for recipe_id, *tag in RecipeTags.objects.filter(
+            recipe_id__in=recipe_ids).order_by('tag_id').values_list(
+                'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)):
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, tag)))
+    ingredients = defaultdict(list)
+    for recipe_id, *ingredient in RecipeIngredients.objects.filter(
+            recipe_id__in=recipe_ids).order_by('id').values_list(
+                'recipe_id', 'ingredient__id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+        ingredients[recipe_id].append(dict(zip(INGREDIENT_FIELDS, ingredient)))
+    return [
+        {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': {
+                **{field: row[f'author__{field}'] for field in USER_FIELDS},
+                'is_subscribed': row['author_is_subscribed'],
+            },
+            'ingredients': ingredients[row['id']],
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'name': row['name'],
+            'image': image_url(row['image'], request),
+            'images': image_sizes(row['image'], row['image_sizes'], request),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    ]
+
+
+def short_recipe(recipe, request):
+    """Рецепт в формате RecipeSerializer."""
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': image_url(recipe.image.name, request),
+        'images': image_sizes(recipe.image.name, recipe.image_sizes, request),
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def subscriptions(rows, recipes_limit, request):
+    """Авторы в формате SubscribeSerializer."""
+    recipes_by_author = author_recipes(
+        [row['id'] for row in rows], recipes_limit)
+    return [
+        {
+            **{field: row[field] for field in USER_FIELDS},
+            'is_subscribed': row['is_subscribed'],
+            'recipes': [short_recipe(recipe, request)
+                        for recipe in recipes_by_author[row['id']]],
+            'recipes_count': row['recipes_count'],
+        }
+        for row in rows
+    ]
@@ -1,13 +1,23 @@
+from collections import Counter
+
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from rest_framework.serializers import (IntegerField, ModelSerializer,
+from rest_framework.serializers import (FileField, IntegerField, ListField,
+                                        ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField, ValidationError)
+                                        Serializer, SerializerMethodField,
+                                        ValidationError)
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
-                            ShoppingCart, Tag, User)
+from recipes import search, shopping_list
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeImageUpload,
+                            RecipeIngredients, ShoppingCart, Tag, User)
 from users.models import Subscription
-from .utils import Base64ImageField
+from .utils import (Base64ImageField, ImageSizesField,
+                    set_prefetched_objects, validate_image_file)
+
+RECIPE_IDS_MAX_LENGTH = 100
+RECIPES_LIMIT_MAX = 100
 
 
 class UserReadSerializer(UserSerializer):
@@ -26,6 +36,8 @@ class UserReadSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if (self.context.get('request')
            and not self.context['request'].user.is_anonymous):
             return Subscription.objects.filter(
@@ -38,6 +50,7 @@ class RecipeSerializer(ModelSerializer):
     """Список рецептов."""
     name = ReadOnlyField()
     cooking_time = ReadOnlyField()
+    images = ImageSizesField()
 
     class Meta:
         model = Recipe
@@ -45,10 +58,48 @@ class RecipeSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
 
+class RecipeIdsSerializer(Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+    recipes = ListField(
+        child=IntegerField(),
+        allow_empty=False,
+        max_length=RECIPE_IDS_MAX_LENGTH
+    )
+
+    def validate_recipes(self, ids):
+        ids = list(dict.fromkeys(ids))
+        recipes = Recipe.objects.in_bulk(ids)
+        missing = [id for id in ids if id not in recipes]
+        if missing:
+            raise ValidationError(
+                'Указанных рецептов не существует: {}'.format(
+                    ', '.join(map(str, missing))))
+        return [recipes[id] for id in ids]
+
+
+class RecipesLimitSerializer(Serializer):
+    """Параметр recipes_limit: сколько рецептов автора показывать."""
+    recipes_limit = IntegerField(
+        min_value=0,
+        required=False,
+        default=RECIPES_LIMIT_MAX
+    )
+
+    def validate_recipes_limit(self, value):
+        return min(value, RECIPES_LIMIT_MAX)
+
+    @classmethod
+    def get_limit(cls, request):
+        serializer = cls(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes_limit']
+
+
 class SubscribeSerializer(UserCreateSerializer):
     """Подписка на автора и отписка (методы GET, POST, DELETE)."""
     email = ReadOnlyField()
@@ -80,11 +131,11 @@ class SubscribeSerializer(UserCreateSerializer):
             author = self.context['author']
             if user == author:
                 raise ValidationError('Нельзя подписаться на самого себя')
-            if Subscription.objects.filter(user=user, author=author).exists():
-                raise ValidationError('Нельзя оформить подписку дважды')
         return data
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -92,15 +143,18 @@ class SubscribeSerializer(UserCreateSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-        serializer = RecipeSerializer(recipes, many=True, read_only=True)
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()[:RecipesLimitSerializer.get_limit(
+                self.context['request'])]
+        serializer = RecipeSerializer(
+            recipes, many=True, read_only=True, context=self.context)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -149,6 +203,7 @@ class RecipeReadSerializer(ModelSerializer):
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
     image = Base64ImageField()
+    images = ImageSizesField()
 
     class Meta:
         model = Recipe
@@ -161,11 +216,19 @@ class RecipeReadSerializer(ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time'
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -173,6 +236,8 @@ class RecipeReadSerializer(ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -192,15 +257,33 @@ class RecipeIngredientCreateSerializer(ModelSerializer):
         )
 
 
+class RecipeImageUploadSerializer(ModelSerializer):
+    """Предварительная загрузка изображения рецепта (метод POST)."""
+    image = FileField()
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = (
+            'id',
+            'image'
+        )
+
+    def validate_image(self, image):
+        image.name = 'photo.' + validate_image_file(image)
+        return image
+
+
 class RecipeCreateSerializer(ModelSerializer):
     """Создание, изменение и удаление рецепта (методы POST, PATCH, DELETE)."""
-    tags = PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = ListField(child=IntegerField())
     author = UserReadSerializer(read_only=True)
     ingredients = RecipeIngredientCreateSerializer(many=True)
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
+    image_upload = PrimaryKeyRelatedField(
+        queryset=RecipeImageUpload.objects.all(),
+        required=False,
+        write_only=True
+    )
 
     class Meta:
         model = Recipe
@@ -209,6 +292,7 @@ class RecipeCreateSerializer(ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_upload',
             'name',
             'text',
             'cooking_time',
@@ -223,42 +307,106 @@ class RecipeCreateSerializer(ModelSerializer):
             'cooking_time': {'required': True},
         }
 
-    def tags_and_ingredients_validating(self, current_obj, class_name):
-        models_dict = {
-            'tags': Tag,
-            'ingredients': Ingredient
-        }
-        obj_list = []
-        for item in current_obj:
-            id = item if class_name == 'tags' else item['id']
-            if not models_dict[class_name].objects.filter(id=id).exists():
-                raise ValidationError('Указано несуществующее значение')
-            current_model = models_dict[class_name].objects.get(id=id)
-            if current_model in obj_list:
-                raise ValidationError('Значения не могут повторяться')
-            obj_list.append(current_model)
+    def tags_and_ingredients_validating(self, ids, model):
+        """Один запрос на модель: объекты по id и список ошибок."""
+        objects = model.objects.in_bulk(set(ids))
+        errors = []
+        missing = sorted(set(ids) - objects.keys())
+        if missing:
+            errors.append('Указано несуществующее значение: {}'.format(
+                ', '.join(map(str, missing))))
+        duplicates = sorted(id for id, count in Counter(ids).items()
+                            if count > 1)
+        if duplicates:
+            errors.append('Значения не могут повторяться: {}'.format(
+                ', '.join(map(str, duplicates))))
+        return objects, errors
 
     def validate(self, data):
-        tags = self.initial_data.get('tags')
-        if not tags:
-            raise ValidationError('Нужно указать минимум 1 тег.')
-        self.tags_and_ingredients_validating(tags, 'tags')
+        errors = {}
+        tags = data.get('tags')
+        if not tags and ('tags' in data or not self.partial):
+            errors['tags'] = ['Нужно указать минимум 1 тег.']
+        elif tags:
+            tags_by_id, errors['tags'] = self.tags_and_ingredients_validating(
+                tags, Tag)
+            data['tags'] = [tags_by_id.get(id) for id in tags]
 
         ingredients = data.get('ingredients')
-        if not ingredients:
-            raise ValidationError('Нужно указать минимум 1 ингредиент.')
-        self.tags_and_ingredients_validating(ingredients, 'ingredients')
+        if not ingredients and ('ingredients' in data or not self.partial):
+            errors['ingredients'] = ['Нужно указать минимум 1 ингредиент.']
+        elif ingredients:
+            ingredients_by_id, errors['ingredients'] = (
+                self.tags_and_ingredients_validating(
+                    [item['id'] for item in ingredients], Ingredient))
+            for item in ingredients:
+                item['ingredient'] = ingredients_by_id.get(item['id'])
+
+        image_upload = data.pop('image_upload', None)
+        if image_upload is not None:
+            if image_upload.author != self.context['request'].user:
+                errors['image_upload'] = ['Изображение не найдено.']
+            else:
+                data['image'] = image_upload.image.name
+                self.image_upload = image_upload
+        elif not data.get('image') and not self.partial:
+            errors['image'] = ['Нужно загрузить изображение.']
+
+        errors = {field: messages for field, messages in errors.items()
+                  if messages}
+        if errors:
+            raise ValidationError(errors)
         return data
 
-    @transaction.atomic
-    def tags_and_ingredients_set(self, recipe, tags, ingredients):
-        recipe.tags.set(tags)
-        RecipeIngredients.objects.bulk_create(
-            [RecipeIngredients(
+    def tags_update(self, recipe, tags):
+        """Меняет теги, только если изменился их набор."""
+        if sorted(tag.id for tag in tags) != sorted(recipe.tag_ids):
+            recipe.tags.set(tags)
+        set_prefetched_objects(
+            recipe, 'tags', sorted(tags, key=lambda tag: tag.id))
+
+    def ingredients_update(self, recipe, ingredients, existing=()):
+        """Применяет разницу между текущими и новыми ингредиентами.
+
+        Новые строки добавляются одним bulk_create, измененные количества
+        сохраняются одним bulk_update, удаленные строки - одним DELETE.
+        """
+        existing = {row.ingredient_id: row for row in existing}
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        new_amounts = {item['id']: item['amount'] for item in ingredients}
+        to_create = [
+            RecipeIngredients(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
+                ingredient=item['ingredient'],
+                amount=item['amount']
+            ) for item in ingredients if item['id'] not in existing
+        ]
+        to_update = []
+        removed = []
+        for ingredient_id, row in existing.items():
+            if ingredient_id not in new_amounts:
+                removed.append(row.pk)
+            elif row.amount != new_amounts[ingredient_id]:
+                row.amount = new_amounts[ingredient_id]
+                to_update.append(row)
+        if removed:
+            RecipeIngredients.objects.filter(pk__in=removed).delete()
+        if to_update:
+            RecipeIngredients.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            RecipeIngredients.objects.bulk_create(to_create)
+        if existing:
+            shopping_list.change_recipe(recipe.id, old_amounts, new_amounts)
+            if removed or to_create:
+                search.schedule_refresh([recipe.id])
+        set_prefetched_objects(
+            recipe,
+            'recipes',
+            [row for row in existing.values() if row.pk not in removed]
+            + to_create
         )
 
     @transaction.atomic
@@ -269,24 +417,48 @@ class RecipeCreateSerializer(ModelSerializer):
             author=self.context['user'],
             **validated_data
         )
-        self.tags_and_ingredients_set(recipe, tags, ingredients)
+        self.tags_update(recipe, tags)
+        self.ingredients_update(recipe, ingredients)
+        self.image_upload_used()
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time)
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredients.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()).delete()
-        self.tags_and_ingredients_set(instance, tags, ingredients)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        if tags is not None:
+            self.tags_update(instance, tags)
+        if ingredients is not None:
+            self.ingredients_update(
+                instance,
+                ingredients,
+                instance.recipes.select_related('ingredient').order_by('pk')
+            )
+        self.image_upload_used()
         return instance
 
+    def image_upload_used(self):
+        """Файл уже принадлежит рецепту, запись о загрузке не нужна."""
+        image_upload = getattr(self, 'image_upload', None)
+        if image_upload is not None:
+            image_upload.delete()
+
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient')
+            )
+        )
         return RecipeReadSerializer(instance, context=self.context).data
@@ -0,0 +1,84 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.links import links_changed
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            User)
+from recipes.shopping_list import lists_changed
+from recipes.transactions import on_commit_once
+from .authentication import token_cache
+from .cache import bump_version
+from .counts import RECIPES_COUNT_VERSION, user_count_version
+from .ingredients_index import INGREDIENTS_VERSION
+from .mixins import TAGS_VERSION
+from .renderers import SHOPPING_LISTS_VERSION, shopping_list_version
+
+
+def bump_versions(names):
+    for name in names:
+        bump_version(name)
+
+
+def bump_on_commit(*names):
+    """Меняет версии один раз после коммита, сколько бы сигналов ни было."""
+    on_commit_once('data-versions', names, bump_versions)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+def invalidate_recipes_count(**kwargs):
+    bump_on_commit(RECIPES_COUNT_VERSION)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_count_by_tags(action, **kwargs):
+    if action.startswith('post_'):
+        bump_on_commit(RECIPES_COUNT_VERSION)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def invalidate_user_recipes_count(instance, **kwargs):
+    bump_on_commit(user_count_version(instance.user_id))
+
+
+@receiver(links_changed)
+def invalidate_users_recipes_count(user_ids, **kwargs):
+    bump_on_commit(*[user_count_version(user_id) for user_id in user_ids])
+
+
+@receiver(lists_changed)
+def invalidate_shopping_lists(user_ids, **kwargs):
+    if user_ids is None:
+        bump_on_commit(SHOPPING_LISTS_VERSION)
+    else:
+        bump_on_commit(
+            *[shopping_list_version(user_id) for user_id in user_ids])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version(TAGS_VERSION)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    """Смена пароля, деактивация и любое другое изменение пользователя."""
+    if created:
+        return
+    token_cache.delete(*Token.objects.filter(
+        user_id=instance.pk).values_list('key', flat=True))
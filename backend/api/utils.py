@@ -1,13 +1,142 @@
 import base64
+import binascii
 
+from django.conf import settings
 from django.core.files.base import ContentFile
-from rest_framework.serializers import ImageField
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.serializers import Field, ImageField, ValidationError
+
+from recipes.images import IMAGE_FORMATS, IMAGE_SIZES
+from recipes.models import Recipe
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def image_extension(header):
+    """Формат изображения по первым байтам файла."""
+    for signature, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    raise ValidationError('Неподдерживаемый формат изображения')
+
+
+def check_image_size(size):
+    if size > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ValidationError(
+            'Размер изображения не должен превышать {} байт'.format(
+                settings.RECIPE_IMAGE_MAX_SIZE))
+
+
+def validate_image_file(file):
+    """Проверка размера и сигнатуры файла до разбора изображения."""
+    check_image_size(file.size)
+    header = file.read(12)
+    file.seek(0)
+    return image_extension(header)
 
 
 class Base64ImageField(ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
+            check_image_size(len(imgstr) * 3 // 4)
+            try:
+                ext = image_extension(base64.b64decode(imgstr[:16]))
+                data = ContentFile(
+                    base64.b64decode(imgstr), name='photo.' + ext)
+            except binascii.Error:
+                raise ValidationError('Некорректная строка base64')
+        elif hasattr(data, 'read') and hasattr(data, 'size'):
+            data.name = 'photo.' + validate_image_file(data)
         return super().to_internal_value(data)
+
+
+def set_prefetched_objects(instance, name, objects):
+    """Кладет объекты в кэш prefetch_related, как это делает Django."""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[name] = queryset
+
+
+class ImageSizesField(Field):
+    """Ссылки на уменьшенные копии фотографии рецепта.
+
+    Пока копии не готовы, для всех размеров отдается оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        return image_size_urls(
+            recipe.image.storage, recipe.image.name, recipe.image_sizes,
+            self.context.get('request'))
+
+
+def image_size_urls(storage, image, image_sizes, request=None):
+    """Ссылки на копии фотографии `image` всех размеров и форматов."""
+    sizes = {}
+    if image_sizes.get('source') == image:
+        sizes = image_sizes['sizes']
+    result = {}
+    for size in IMAGE_SIZES:
+        result[size] = {}
+        for image_format in IMAGE_FORMATS:
+            name = sizes.get(size, {}).get(image_format)
+            url = storage.url(name or image)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            result[size][image_format] = url
+    return result
+
+
+def prefetch_author_recipes(authors, limit):
+    """Первые `limit` рецептов в атрибуте `limited_recipes` авторов."""
+    authors = list(authors)
+    recipes = author_recipes([author.pk for author in authors], limit)
+    for author in authors:
+        author.limited_recipes = recipes[author.pk]
+
+
+def author_recipes(author_ids, limit):
+    """Первые `limit` рецептов авторов одним запросом.
+
+    Рецепты нумеруются ROW_NUMBER() OVER (PARTITION BY author_id),
+    результат: {author_id: [Recipe, ...]}.
+    """
+    result = {author_id: [] for author_id in author_ids}
+    if not author_ids or not limit:
+        return result
+    ranked = Recipe.objects.filter(
+        author__in=author_ids
+    ).annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )
+    )
+    sql, params = ranked.query.sql_with_params()
+    recipes = Recipe.objects.raw(
+        f'SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s '
+        'ORDER BY ranked.author_id, ranked.row_number',
+        (*params, limit)
+    )
+    for recipe in recipes:
+        result[recipe.author_id].append(recipe)
+    return result
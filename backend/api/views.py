@@ -1,29 +1,69 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (Count, Exists, OuterRef, Prefetch, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import mixins, status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FileUploadParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
-                            ShoppingCart, Tag, User)
+from recipes import links
+from recipes.feed import pull_celebrities
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredients, ShoppingCart, ShoppingListItem,
+                            Tag, User)
 from users.models import Subscription
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .cache import get_versions
+from .counts import AdaptiveCountStrategy
+from .filters import RECIPE_ORDERINGS, RecipeFilter
+from .ingredients_index import (INGREDIENTS_VERSION, ingredient_index,
+                                usage_epoch)
+from .mixins import TAGS_VERSION, VersionedCacheMixin
+from .pagination import CustomCursorPagination, CustomPagination
+from . import representations
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (SHOPPING_LISTS_VERSION, CSVShoppingListRenderer,
+                        JSONShoppingListRenderer, PDFShoppingListRenderer,
+                        TextShoppingListRenderer, shopping_list_version)
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
+                          RecipeIdsSerializer, RecipeImageUploadSerializer,
                           RecipeReadSerializer, RecipeSerializer,
-                          SubscribeSerializer, TagSerializer,
-                          UserReadSerializer)
+                          RecipesLimitSerializer, SubscribeSerializer,
+                          TagSerializer, UserReadSerializer)
+from .utils import check_image_size, prefetch_author_recipes
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+FEED_ORDERING = ('-pub_date', '-recipe_id')
 
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = CustomPagination
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk')))
+        )
 
     @action(
         detail=False,
@@ -41,8 +81,24 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        recipes_limit = RecipesLimitSerializer.get_limit(request)
+        queryset = User.objects.filter(
+            subscribing__user=request.user
+        ).annotate(
+            recipes_count=Coalesce(Subquery(
+                Recipe.objects.filter(author=OuterRef('pk'))
+                .order_by().values('author')
+                .annotate(count=Count('pk')).values('count')
+            ), 0),
+            is_subscribed=Value(True)
+        )
+        if settings.FAST_READ_PATH:
+            page = self.paginate_queryset(
+                queryset.values(*representations.SUBSCRIPTION_VALUES))
+            return self.get_paginated_response(
+                representations.subscriptions(page, recipes_limit, request))
         page = self.paginate_queryset(queryset)
+        prefetch_author_recipes(page, recipes_limit)
         serializer = self.get_serializer(
             page,
             many=True,
@@ -59,62 +115,156 @@ class SubscribeViewSet(mixins.ListModelMixin,
     pagination_class = CustomPagination
 
     def create(self, request, author_id=None):
+        """Подписка опирается на ограничение unique_subscribe: повторная
+        или параллельная вставка не блокирует строки, а возвращает 400.
+        """
         user = request.user
-        author = get_object_or_404(User, id=author_id)
+        author = get_object_or_404(
+            User.objects.annotate(recipes_count=Count('recipes')),
+            id=author_id
+        )
         serializer = SubscribeSerializer(
             author,
             data=request.data,
             context={'author': author, 'request': request}
         )
-        if serializer.is_valid(raise_exception=True):
-            Subscription.objects.create(user=user, author=author)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.is_valid(raise_exception=True)
+        recipes_limit = RecipesLimitSerializer.get_limit(request)
+        try:
+            with transaction.atomic():
+                Subscription.objects.create(user=user, author=author)
+        except IntegrityError:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Нельзя оформить подписку дважды']
+            })
+        author.is_subscribed = True
+        prefetch_author_recipes([author], recipes_limit)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, author_id=None):
         user = request.user
-        author = get_object_or_404(User, id=author_id)
-        subscribe = Subscription.objects.filter(user=user, author=author)
-        if not subscribe:
+        deleted, _ = Subscription.objects.filter(
+            user=user, author_id=author_id).delete()
+        if not deleted:
+            get_object_or_404(User, id=author_id)
             return Response(
                 'Подписки не существует, или она уже удалена',
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscribe.delete()
         return Response(
             'Вы успешно отписались от автора',
             status=status.HTTP_204_NO_CONTENT
         )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny, )
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
+    cache_version_name = INGREDIENTS_VERSION
+
+    def get_cache_key(self, request):
+        """Результаты поиска зависят и от популярности ингредиентов."""
+        cache_key = super().get_cache_key(request)
+        if request.query_params.get('name'):
+            return f'{cache_key}:{usage_epoch()}'
+        return cache_key
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.index_list)
 
+    def index_list(self, request):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(
+                name, data_version=self.data_version))
+        return Response(ingredient_index.all(self.data_version))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = (AllowAny, )
     serializer_class = TagSerializer
     pagination_class = None
+    cache_version_name = TAGS_VERSION
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = CustomPagination
+    count_strategy = AdaptiveCountStrategy()
     permission_classes = (IsAuthorOrReadOnly, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        """Порядок для вывода по курсору.
+
+        Курсор не умеет продолжать выдачу по релевантности, поэтому
+        поиск без явного `ordering` всегда выводится по страницам.
+        """
+        params = self.request.query_params
+        ordering = params.get('ordering')
+        if not ordering and params.get('search'):
+            return None
+        return RECIPE_ORDERINGS.get(ordering, RECIPE_ORDERINGS['newest'])
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve', 'feed'):
+            return queryset
+        queryset = queryset.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient').order_by('id')
+            )
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False)
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')))
+        )
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Быстрый путь: словари из values() вместо сериализаторов."""
+        if not settings.FAST_READ_PATH:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(representations.recipe_values(
+            self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(
+            representations.recipes(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FAST_READ_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        row = generics.get_object_or_404(
+            representations.recipe_values(
+                self.filter_queryset(self.get_queryset())),
+            pk=kwargs['pk']
+        )
+        self.check_object_permissions(request, row)
+        return Response(representations.recipes([row], request)[0])
+
     def create(self, request, *args, **kwargs):
         if request.user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -139,21 +289,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Страница ленты читается одним запросом по индексу таблицы
+        FeedEntry, затем рецепты загружаются как в обычном списке.
+        """
+        pull_celebrities(request.user.id)
+        paginator = CustomCursorPagination(FEED_ORDERING)
+        entries = paginator.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user).only(
+                'recipe_id', 'pub_date'),
+            request,
+            self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries])
+        serializer = RecipeReadSerializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='images',
+        permission_classes=(IsAuthenticated,),
+        parser_classes=(MultiPartParser, FileUploadParser)
+    )
+    def upload_image(self, request):
+        """Загрузка изображения файлом: multipart/form-data с полем image
+        или телом запроса с заголовком Content-Disposition.
+        """
+        check_image_size(int(request.META.get('CONTENT_LENGTH') or 0))
+        data = request.data
+        if 'file' in data:
+            data = {'image': data['file']}
+        serializer = RecipeImageUploadSerializer(
+            data=data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(author=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     def recipe_additional_info(self, model, req, pk):
         user = req.user
         if req.method == 'POST':
-            if not Recipe.objects.filter(id=pk).exists():
+            recipe = Recipe.objects.filter(id=pk).first()
+            if recipe is None:
                 return Response(
                     'Указанного рецепта не существует',
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            recipe = Recipe.objects.get(id=pk)
-            if model.objects.filter(user=user, recipe=recipe).exists():
+            if not links.change(model, user.id, [recipe.id], 1):
                 return Response(
                     'Рецепт уже добавлен',
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            model.objects.create(user=user, recipe=recipe)
             serializer = RecipeSerializer(recipe, context={'request': req})
             return Response(
                 serializer.data,
@@ -161,19 +362,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
 
         if req.method == 'DELETE':
-            recipe = get_object_or_404(Recipe, id=pk)
-            current_model = model.objects.filter(user=user, recipe=recipe)
-            if not current_model.exists():
+            if not links.change(model, user.id, [int(pk)], -1):
+                get_object_or_404(Recipe, id=pk)
                 return Response(
                     'Указанного рецепта нет, или он уже удален',
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            current_model.delete()
             return Response(
                 'Рецепт успешно удален',
                 status=status.HTTP_204_NO_CONTENT
             )
 
+    def recipes_bulk_info(self, model, req):
+        """Добавление и удаление нескольких рецептов одним запросом.
+
+        Рецепты вставляются одним INSERT ... ON CONFLICT DO NOTHING
+        и удаляются одним DELETE, счетчики и список покупок меняются
+        только для действительно затронутых строк (см. recipes.links).
+        """
+        user = req.user
+        serializer = RecipeIdsSerializer(data=req.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        changed_ids = links.change(
+            model, user.id, [recipe.id for recipe in recipes],
+            1 if req.method == 'POST' else -1
+        )
+        changed = [recipe for recipe in recipes if recipe.id in changed_ids]
+        if req.method == 'POST':
+            serializer = RecipeSerializer(
+                changed, many=True, context={'request': req})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not changed:
+            return Response(
+                'Указанных рецептов нет, или они уже удалены',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            'Рецепты успешно удалены',
+            status=status.HTTP_204_NO_CONTENT
+        )
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -182,6 +411,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, **kwargs):
         return self.recipe_additional_info(Favorite, request, kwargs['pk'])
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_bulk(self, request):
+        return self.recipes_bulk_info(Favorite, request)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -191,25 +429,51 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, **kwargs):
         return self.recipe_additional_info(ShoppingCart, request, kwargs['pk'])
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_bulk(self, request):
+        return self.recipes_bulk_info(ShoppingCart, request)
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TextShoppingListRenderer, CSVShoppingListRenderer,
+                          JSONShoppingListRenderer, PDFShoppingListRenderer)
     )
     def download_shopping_cart(self, request, **kwargs):
-        ingredients = (
-            RecipeIngredients.objects
-            .filter(recipe__recipes_shoppingcart_related__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
-                         'ingredient__measurement_unit')
-        )
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = ('attachment; '
-                                       'filename="shopping_cart.txt"')
-        return file
+        renderer = request.accepted_renderer
+        items = ShoppingListItem.objects.filter(user=request.user)
+        contents = hashlib.md5(repr((
+            renderer.format,
+            *get_versions(
+                INGREDIENTS_VERSION,
+                SHOPPING_LISTS_VERSION,
+                shopping_list_version(request.user.pk)
+            )
+        )).encode()).hexdigest()
+        etag = quote_etag(contents)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = StreamingHttpResponse(
+                renderer.stream(
+                    items.order_by('ingredient__name')
+                    .values_list('ingredient__name', 'total_amount',
+                                 'ingredient__measurement_unit')
+                    .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+                ),
+                content_type=renderer.media_type
+            )
+            if renderer.charset:
+                response['Content-Type'] += f'; charset={renderer.charset}'
+            response['Content-Disposition'] = (
+                'attachment; '
+                f'filename="shopping_cart.{renderer.format}"'
+            )
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,13 @@
+import json
+import logging
+
+
+class QueryStatsFormatter(logging.Formatter):
+    """Добавляет к сообщению поле `query_stats` из extra в виде JSON."""
+
+    def format(self, record):
+        message = super().format(record)
+        stats = getattr(record, 'query_stats', None)
+        if stats is None:
+            return message
+        return f'{message} {json.dumps(stats, ensure_ascii=False)}'
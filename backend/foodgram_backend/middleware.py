@@ -0,0 +1,136 @@
+import heapq
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('foodgram.queries')
+
+PLACEHOLDERS_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+SLOW_QUERY_SQL_LENGTH = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запрос к API выполнил больше SQL-запросов, чем разрешено."""
+
+
+class QueryRecorder:
+    """Обертка `execute_wrapper`: время и текст каждого SQL-запроса."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, count):
+        return heapq.nlargest(count, self.queries, key=lambda row: row[1])
+
+    def repeated_shapes(self, threshold):
+        """Одинаковые с точностью до параметров запросы: вероятный N+1."""
+        shapes = Counter(
+            PLACEHOLDERS_RE.sub('(%s)', sql) for sql, _ in self.queries)
+        return {shape: count for shape, count in shapes.items()
+                if count >= threshold}
+
+
+def endpoint_name(view_func, request):
+    """`RecipeViewSet.list`, `RecipeViewSet.download_shopping_cart` и т.п."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', repr(view_func))
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryInstrumentationMiddleware:
+    """Число SQL-запросов и время работы с базой на каждый запрос к API.
+
+    Итог пишется в лог `foodgram.queries` и, при `QUERY_SERVER_TIMING`,
+    передается клиенту в заголовке Server-Timing. По умолчанию оба
+    режима включены только при DEBUG.
+    Повторяющиеся запросы отмечаются как вероятный N+1, превышение
+    бюджета из `QUERY_BUDGETS` пишется в лог или, при
+    `QUERY_BUDGET_RAISE`, завершается исключением (для тестов).
+    Запросы, выполненные при отдаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSTRUMENTATION:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        endpoint = getattr(request, 'endpoint_name', None)
+        if endpoint is None:
+            return response
+        if settings.QUERY_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f};'
+                f'desc="{len(recorder.queries)} queries", '
+                f'app;dur={total * 1000:.1f}'
+            )
+        self.report(request, response, endpoint, recorder, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.endpoint_name = endpoint_name(view_func, request)
+
+    def report(self, request, response, endpoint, recorder, total):
+        repeated = recorder.repeated_shapes(
+            settings.QUERY_N_PLUS_ONE_THRESHOLD)
+        data = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': len(recorder.queries),
+            'db_time_ms': round(recorder.duration * 1000, 1),
+            'total_time_ms': round(total * 1000, 1),
+            'slowest': [
+                {'sql': sql[:SLOW_QUERY_SQL_LENGTH],
+                 'time_ms': round(duration * 1000, 1)}
+                for sql, duration in recorder.slowest(
+                    settings.QUERY_SLOWEST_COUNT)
+            ],
+        }
+        logger.info(
+            '%s %s: %d queries, %.1f ms in db',
+            endpoint, request.path, data['queries'], data['db_time_ms'],
+            extra={'query_stats': data}
+        )
+        for shape, count in repeated.items():
+            logger.warning(
+                '%s: possible N+1, query repeated %d times: %s',
+                endpoint, count, shape[:SLOW_QUERY_SQL_LENGTH],
+                extra={'query_stats': data}
+            )
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+        if budget is not None and data['queries'] > budget:
+            message = (
+                f'{endpoint}: {data["queries"]} queries, '
+                f'budget is {budget}'
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'query_stats': data})
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram_backend.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +76,23 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+DATA_VERSION_MEMO_TIMEOUT = float(os.getenv('DATA_VERSION_MEMO_TIMEOUT', 2))
+
+REFERENCE_DATA_CACHE_TIMEOUT = int(os.getenv('REFERENCE_DATA_CACHE_TIMEOUT', 60 * 60 * 24))
+REFERENCE_DATA_MAX_AGE = int(os.getenv('REFERENCE_DATA_MAX_AGE', 60))
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv('TOKEN_CACHE_MAX_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 30))
+TOKEN_CACHE_SHARED_ALIAS = os.getenv('TOKEN_CACHE_SHARED_ALIAS', '')
+TOKEN_CACHE_SHARED_TIMEOUT = int(os.getenv('TOKEN_CACHE_SHARED_TIMEOUT', 60 * 5))
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -100,7 +118,12 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
@@ -114,6 +137,67 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': PAGE_SIZE_VALUE,
 }
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+
+SHOPPING_LIST_PDF_FONT = os.getenv('SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+FAST_READ_PATH = os.getenv('FAST_READ_PATH', 'True') == 'True'
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_USAGE_REFRESH_INTERVAL = int(os.getenv('INGREDIENT_USAGE_REFRESH_INTERVAL', 60 * 5))
+INGREDIENT_INDEX_CHECK_INTERVAL = float(os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', 2))
+
+FEED_FAN_OUT_WORKERS = int(os.getenv('FEED_FAN_OUT_WORKERS', 1))
+FEED_FAN_OUT_BATCH_SIZE = int(os.getenv('FEED_FAN_OUT_BATCH_SIZE', 1000))
+FEED_FAN_OUT_LIMIT = int(os.getenv('FEED_FAN_OUT_LIMIT', 10000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+FEED_CELEBRITIES_CACHE_TIMEOUT = int(os.getenv('FEED_CELEBRITIES_CACHE_TIMEOUT', 60 * 5))
+
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', str(DEBUG)) == 'True'
+QUERY_SERVER_TIMING = os.getenv('QUERY_SERVER_TIMING', str(DEBUG)) == 'True'
+QUERY_SLOWEST_COUNT = int(os.getenv('QUERY_SLOWEST_COUNT', 3))
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', 5))
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE') == 'True'
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 6,
+    'RecipeViewSet.retrieve': 6,
+    'RecipeViewSet.favorite': 7,
+    'RecipeViewSet.shopping_cart': 11,
+    'RecipeViewSet.download_shopping_cart': 3,
+    'CustomUserViewSet.list': 4,
+    'CustomUserViewSet.subscriptions': 4,
+    'SubscribeViewSet.create': 6,
+    'SubscribeViewSet.delete': 4,
+    'IngredientViewSet.list': 3,
+    'TagViewSet.list': 2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'query_stats': {
+            '()': 'foodgram_backend.log_formatters.QueryStatsFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'queries': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'query_stats',
+        },
+    },
+    'loggers': {
+        'foodgram.queries': {
+            'handlers': ['queries'],
+            'level': os.getenv('QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -1,22 +1,45 @@
+from contextlib import contextmanager
+
 from django.contrib import admin
 from django.contrib.admin import display
 
-from . import models
-from .forms import DeleteFildInlineFormSet
+from . import links, models, search, shopping_list
+from .forms import (DeleteFildInlineFormSet, InstanceAutocompleteForm,
+                    InstanceAutocompleteSelect)
+from .signals import refresh_tag_ids
 
 
-class RecipeTagsInline(admin.TabularInline):
+class AutocompleteInline(admin.TabularInline):
+    """Инлайн, строки которого не запрашивают выбранные объекты."""
+    form = InstanceAutocompleteForm
     formset = DeleteFildInlineFormSet
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = InstanceAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class RecipeTagsInline(AutocompleteInline):
     model = models.RecipeTags
     extra = 0
     min_num = 1
+    autocomplete_fields = ('tag',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe', 'tag')
 
-class RecipeIngredientsInline(admin.TabularInline):
-    formset = DeleteFildInlineFormSet
+
+class RecipeIngredientsInline(AutocompleteInline):
     model = models.RecipeIngredients
     extra = 0
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
 
 
 @admin.register(models.Tag)
@@ -26,8 +49,7 @@ class TagAdmin(admin.ModelAdmin):
         'color',
         'slug'
     )
-    list_filter = ('name',)
-    search_fields = ('name',)
+    search_fields = ('name', 'slug')
 
 
 @admin.register(models.Ingredient)
@@ -36,7 +58,7 @@ class IngredientAdmin(admin.ModelAdmin):
         'name',
         'measurement_unit'
     )
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
 
 
@@ -48,18 +70,28 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'add_in_favorite'
     )
-    list_filter = (
-        'name',
-        'author',
-        'tags'
-    )
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
     readonly_fields = ('add_in_favorite',)
     inlines = (RecipeIngredientsInline, RecipeTagsInline,)
     list_display_links = ('name',)
 
-    @display(description='В избранном')
+    @display(description='В избранном', ordering='favorites_count')
     def add_in_favorite(self, obj):
-        return obj.recipes_favorite_related.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        old_amounts = shopping_list.recipe_amounts([recipe_id])[recipe_id]
+        super().save_related(request, form, formsets, change)
+        form.instance.tag_ids = refresh_tag_ids([recipe_id])[recipe_id]
+        shopping_list.change_recipe(
+            recipe_id,
+            old_amounts,
+            shopping_list.recipe_amounts([recipe_id])[recipe_id]
+        )
 
 
 @admin.register(models.RecipeIngredients)
@@ -69,19 +101,71 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         'ingredient',
         'amount'
     )
-
-
-@admin.register(models.Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    @contextmanager
+    def changing_recipes(self, recipe_ids):
+        """Переносит изменение ингредиентов рецептов в списки покупок
+        и поисковый индекс.
+        """
+        recipe_ids = set(recipe_ids)
+        old_amounts = shopping_list.recipe_amounts(recipe_ids)
+        yield
+        new_amounts = shopping_list.recipe_amounts(recipe_ids)
+        shopping_list.change_recipes({
+            recipe_id: (old_amounts[recipe_id], new_amounts[recipe_id])
+            for recipe_id in recipe_ids
+        })
+        search.schedule_refresh(list(recipe_ids))
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.update(models.RecipeIngredients.objects.filter(
+                pk=obj.pk).values_list('recipe_id', flat=True))
+        with self.changing_recipes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with self.changing_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with self.changing_recipes(
+                queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
+
+class RecipeLinkAdmin(admin.ModelAdmin):
+    """Удаление идет через links.delete_queryset: у избранного и корзины
+    нет сигналов удаления, счетчики рецептов меняются явно.
+    """
     list_display = (
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+
+    def delete_model(self, request, obj):
+        links.delete_queryset(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        links.delete_queryset(queryset)
+
+
+@admin.register(models.Favorite)
+class FavoriteAdmin(RecipeLinkAdmin):
+    pass
 
 
 @admin.register(models.ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = (
-        'user',
-        'recipe'
-    )
+class ShoppingCartAdmin(RecipeLinkAdmin):
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = models.ShoppingCart.objects.get(pk=obj.pk)
+            shopping_list.remove_recipes(old.user_id, [old.recipe_id])
+        super().save_model(request, obj, form, change)
+        shopping_list.add_recipes(obj.user_id, [obj.recipe_id])
@@ -0,0 +1,54 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe, ShoppingCart
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def change(model, recipe_ids, delta):
+    """Атомарно (UPDATE ... SET x = x + delta) меняет счетчик рецептов."""
+    field = COUNTER_FIELDS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: F(field) + delta})
+
+
+def change_many(model, recipe_ids, delta):
+    """Меняет счетчики с учетом повторов id: один UPDATE на кратность."""
+    grouped = defaultdict(list)
+    for recipe_id, count in Counter(recipe_ids).items():
+        grouped[count].append(recipe_id)
+    for count, ids in grouped.items():
+        change(model, ids, delta * count)
+
+
+def actual_counts():
+    """Выражения для счетчиков, посчитанных заново по связям."""
+    return {
+        field: Coalesce(Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe').annotate(count=Count('pk')).values('count')
+        ), 0)
+        for model, field in COUNTER_FIELDS.items()
+    }
+
+
+def mismatches():
+    """Рецепты, у которых сохраненные счетчики не совпадают с реальными."""
+    actual = {f'actual_{field}': expression
+              for field, expression in actual_counts().items()}
+    condition = Q()
+    for field in COUNTER_FIELDS.values():
+        condition |= ~Q(**{field: F(f'actual_{field}')})
+    return Recipe.objects.annotate(**actual).filter(condition).values(
+        'id', *COUNTER_FIELDS.values(), *actual)
+
+
+def reconcile():
+    """Пересчитывает все счетчики одним UPDATE."""
+    return Recipe.objects.update(**actual_counts())
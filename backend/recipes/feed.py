@@ -0,0 +1,163 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from users.models import Subscription
+from .models import FeedEntry, Recipe
+
+logger = logging.getLogger(__name__)
+
+CELEBRITIES_CACHE_KEY = 'feed:celebrities'
+PULL_CACHE_KEY = 'feed:pulled:{}'
+PULL_OVERLAP = timedelta(minutes=1)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_FAN_OUT_WORKERS,
+    thread_name_prefix='feed-fan-out'
+)
+
+
+def celebrity_author_ids():
+    """Авторы, у которых подписчиков больше FEED_FAN_OUT_LIMIT.
+
+    Их рецепты не раскладываются по лентам при публикации, а
+    подтягиваются в ленту подписчика при ее чтении (`pull_celebrities`).
+    """
+    authors = cache.get(CELEBRITIES_CACHE_KEY)
+    if authors is None:
+        authors = set(
+            Subscription.objects.values('author').annotate(
+                followers=Count('id')
+            ).filter(
+                followers__gt=settings.FEED_FAN_OUT_LIMIT
+            ).values_list('author', flat=True)
+        )
+        cache.set(
+            CELEBRITIES_CACHE_KEY, authors,
+            settings.FEED_CELEBRITIES_CACHE_TIMEOUT)
+    return authors
+
+
+def entries(recipes, user_ids):
+    return [
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  pub_date=pub_date)
+        for recipe_id, author_id, pub_date in recipes
+        for user_id in user_ids
+    ]
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора пачками."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'id', 'author_id', 'pub_date').first()
+    if recipe is None or recipe[1] in celebrity_author_ids():
+        return
+    followers = Subscription.objects.filter(
+        author_id=recipe[1]
+    ).values_list('user_id', flat=True).iterator(
+        chunk_size=settings.FEED_FAN_OUT_BATCH_SIZE)
+    batch = []
+    for user_id in followers:
+        batch.append(user_id)
+        if len(batch) == settings.FEED_FAN_OUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(
+                entries([recipe], batch), ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(
+        entries([recipe], batch), ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Последние рецепты автора в ленте нового подписчика."""
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'author_id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        entries(recipes, [user_id]), ignore_conflicts=True)
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Заново заполняет ленты: по FEED_BACKFILL_SIZE последних рецептов
+    каждого автора из подписок, как при подписке (`backfill`).
+    """
+    feed_entries = FeedEntry.objects.all()
+    subscriptions = Subscription.objects.all()
+    if user_ids is not None:
+        feed_entries = feed_entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+    feed_entries.delete()
+    subscribers = defaultdict(list)
+    for user_id, author_id in subscriptions.values_list(
+            'user_id', 'author_id').iterator():
+        subscribers[author_id].append(user_id)
+    batch = []
+    for author_id, followers in subscribers.items():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list(
+            'id', 'author_id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        batch += entries(recipes, followers)
+        if len(batch) >= settings.FEED_FAN_OUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch)
+            batch = []
+    FeedEntry.objects.bulk_create(batch)
+
+
+def remove_author(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pull_celebrities(user_id):
+    """Рецепты популярных авторов, опубликованные с прошлого чтения ленты.
+
+    Выполняется в запросе чтения ленты; если пользователь на таких
+    авторов не подписан, это один запрос к подпискам.
+    """
+    celebrities = celebrity_author_ids()
+    if not celebrities:
+        return
+    authors = list(Subscription.objects.filter(
+        user_id=user_id, author_id__in=celebrities
+    ).values_list('author_id', flat=True))
+    if not authors:
+        return
+    now = timezone.now()
+    key = PULL_CACHE_KEY.format(user_id)
+    pulled = cache.get(key)
+    recipes = Recipe.objects.filter(author_id__in=authors).order_by(
+        '-pub_date', '-id')
+    if pulled is not None:
+        recipes = recipes.filter(pub_date__gt=pulled - PULL_OVERLAP)
+    FeedEntry.objects.bulk_create(
+        entries(
+            recipes.values_list('id', 'author_id', 'pub_date')[
+                :settings.FEED_BACKFILL_SIZE * len(authors)],
+            [user_id]
+        ),
+        ignore_conflicts=True
+    )
+    cache.set(key, now, None)
+
+
+def in_worker(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Не удалось обновить ленты: %s%s',
+                         function.__name__, args)
+    finally:
+        connection.close()
+
+
+def schedule(function, *args):
+    """Выполняет обновление лент в пуле потоков, вне запроса."""
+    executor.submit(in_worker, function, *args)
@@ -0,0 +1,59 @@
+from django.db import models
+from django.db.models import Lookup
+
+
+class IntegerArrayField(models.Field):
+    """Множество целых чисел.
+
+    В PostgreSQL хранится как integer[], в остальных СУБД - строкой
+    вида ',1,5,', по которой можно искать через LIKE.
+    """
+    description = 'Множество целых чисел'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', list)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'integer[]'
+        return 'text'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        return [int(item) for item in value.strip(',').split(',') if item]
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return value
+        value = sorted({int(item) for item in value})
+        if connection.vendor == 'postgresql':
+            return value
+        return ',{},'.format(','.join(map(str, value))) if value else ''
+
+
+@IntegerArrayField.register_lookup
+class Overlap(Lookup):
+    """Есть хотя бы одно общее значение (оператор && в PostgreSQL)."""
+    lookup_name = 'overlap'
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} && {rhs}::integer[]', lhs_params + rhs_params
+
+    def as_sql(self, compiler, connection):
+        values = sorted({int(item) for item in self.rhs})
+        if not values:
+            return '1 = 0', []
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        sql = ' OR '.join([f'{lhs} LIKE %s'] * len(values))
+        params = []
+        for value in values:
+            params += lhs_params + [f'%,{value},%']
+        return f'({sql})', params
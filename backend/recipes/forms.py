@@ -1,4 +1,5 @@
 from django import forms
+from django.contrib.admin.widgets import AutocompleteSelect
 
 
 class DeleteFildInlineFormSet(forms.BaseInlineFormSet):
@@ -15,3 +16,34 @@ class DeleteFildInlineFormSet(forms.BaseInlineFormSet):
             raise forms.ValidationError(
                 'Должно присутствовать хотя бы одно поле'
             )
+
+
+class InstanceAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение, подпись выбранного значения берется из объекта формы.
+
+    Стандартный виджет запрашивает выбранный объект отдельным запросом
+    на каждую строку инлайна.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = self.selected
+        if selected is None or list(value) != [str(selected.pk)]:
+            return super().optgroups(name, value, attr)
+        label = self.choices.field.label_from_instance(selected)
+        return [(None, [
+            self.create_option(name, selected.pk, label, True, 0)
+        ], 0)]
+
+
+class InstanceAutocompleteForm(forms.ModelForm):
+    """Передает загруженные связанные объекты строки в виджеты."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is None:
+            return
+        for name, field in self.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, InstanceAutocompleteSelect):
+                widget.selected = getattr(self.instance, name)
@@ -0,0 +1,104 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZES = {
+    'thumbnail': 150,
+    'card': 480,
+    'full': 1280,
+}
+DERIVATIVES_DIR = 'recipes/images/derivatives/'
+IMAGE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PIPELINE_WORKERS,
+    thread_name_prefix='image-pipeline'
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы хранятся под именем из sha256 содержимого.
+
+    Повторная загрузка того же файла не создает копию, а возвращает
+    имя уже сохраненного файла.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        dir_name, file_name = os.path.split(name)
+        ext = os.path.splitext(file_name)[1].lower()
+        name = os.path.join(dir_name, digest.hexdigest() + ext)
+        if self.exists(name):
+            return name.replace('\\', '/')
+        return self._save(name, content).replace('\\', '/')
+
+
+def generate_derivatives(name, storage):
+    """Уменьшенные копии изображения во всех размерах и форматах."""
+    derivatives = {}
+    with storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+    for size, max_side in IMAGE_SIZES.items():
+        derivatives[size] = {}
+        image = original.copy()
+        image.thumbnail((max_side, max_side))
+        for image_format, pil_format in IMAGE_FORMATS.items():
+            output = io.BytesIO()
+            image.save(output, pil_format, quality=85)
+            derivatives[size][image_format] = storage.save(
+                f'{DERIVATIVES_DIR}{size}.{image_format}',
+                ContentFile(output.getvalue())
+            )
+    return derivatives
+
+
+def process_recipe_image(recipe_id, name):
+    from .models import Recipe
+
+    try:
+        derivatives = generate_derivatives(
+            name, Recipe._meta.get_field('image').storage)
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_sizes={'source': name, 'sizes': derivatives})
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def schedule_recipe_image(recipe):
+    """Ставит обработку изображения рецепта в очередь пула потоков."""
+    if (not recipe.image
+            or recipe.image_sizes.get('source') == recipe.image.name):
+        return
+    executor.submit(process_in_worker, recipe.pk, recipe.image.name)
@@ -0,0 +1,127 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from . import counters, shopping_list
+from .models import ShoppingCart, User
+
+RETURNING_MIN_SQLITE_VERSION = (3, 35)
+
+# Отправляется после изменения избранного или корзины пользователей
+# (аргумент user_ids): строки меняются без сигналов моделей.
+links_changed = Signal()
+
+
+def lock_user(user_id):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Все изменения избранного и корзины через API идут под этой
+    блокировкой, поэтому выполняются для одного пользователя по очереди.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user_id).values_list('pk', flat=True))
+
+
+def supports_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    return (connection.vendor == 'sqlite'
+            and connection.Database.sqlite_version_info
+            >= RETURNING_MIN_SQLITE_VERSION)
+
+
+def execute_returning(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def insert(model, user_id, recipe_ids):
+    """Вставляет строки, возвращает id рецептов, которых еще не было."""
+    if supports_returning():
+        return execute_returning(
+            'INSERT INTO {} (user_id, recipe_id) VALUES {} '
+            'ON CONFLICT DO NOTHING RETURNING recipe_id'.format(
+                connection.ops.quote_name(model._meta.db_table),
+                ', '.join(['(%s, %s)'] * len(recipe_ids))),
+            [value for recipe_id in recipe_ids
+             for value in (user_id, recipe_id)]
+        )
+    existing = set(model.objects.filter(
+        user_id=user_id, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    model.objects.bulk_create(
+        [model(user_id=user_id, recipe_id=recipe_id)
+         for recipe_id in recipe_ids if recipe_id not in existing],
+        ignore_conflicts=True
+    )
+    return set(recipe_ids) - existing
+
+
+def delete(model, user_id, recipe_ids):
+    """Удаляет строки без сигналов, возвращает id удаленных рецептов."""
+    if supports_returning():
+        return execute_returning(
+            'DELETE FROM {} WHERE user_id = %s AND recipe_id IN ({}) '
+            'RETURNING recipe_id'.format(
+                connection.ops.quote_name(model._meta.db_table),
+                ', '.join(['%s'] * len(recipe_ids))),
+            [user_id, *recipe_ids]
+        )
+    rows = model.objects.filter(user_id=user_id, recipe_id__in=recipe_ids)
+    deleted = set(rows.values_list('recipe_id', flat=True))
+    rows.delete()
+    return deleted
+
+
+def change(model, user_id, recipe_ids, sign):
+    """Добавляет (sign=1) или удаляет (sign=-1) рецепты пользователя.
+
+    Счетчики рецептов и список покупок меняются только для строк,
+    которые действительно вставил или удалил этот запрос, поэтому
+    параллельные запросы не учитывают один рецепт дважды. Сигналы
+    моделей не отправляются. Возвращает множество измененных id.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if not recipe_ids:
+        return set()
+    with transaction.atomic():
+        lock_user(user_id)
+        if sign > 0:
+            changed = insert(model, user_id, recipe_ids)
+        else:
+            changed = delete(model, user_id, recipe_ids)
+        ordered = [
+            recipe_id for recipe_id in recipe_ids if recipe_id in changed]
+        counters.change(model, ordered, sign)
+        if model is ShoppingCart:
+            shopping_list.add_recipes(
+                user_id, ordered, sign=sign, locked=True)
+    if changed:
+        links_changed.send(sender=model, user_ids=[user_id])
+    return changed
+
+
+def delete_queryset(queryset):
+    """Удаляет строки избранного или корзины, например из админки.
+
+    Строки удаляются одним DELETE, счетчики меняются одним UPDATE
+    на каждую кратность, списки покупок - по одному разу на
+    пользователя.
+    """
+    model = queryset.model
+    recipes_by_user = defaultdict(list)
+    with transaction.atomic():
+        rows = list(queryset.order_by().select_for_update().values_list(
+            'pk', 'user_id', 'recipe_id'))
+        model.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        counters.change_many(
+            model, [recipe_id for _, _, recipe_id in rows], -1)
+        for _, user_id, recipe_id in rows:
+            recipes_by_user[user_id].append(recipe_id)
+        if model is ShoppingCart:
+            for user_id, recipe_ids in recipes_by_user.items():
+                shopping_list.remove_recipes(user_id, recipe_ids)
+    if recipes_by_user:
+        links_changed.send(sender=model, user_ids=list(recipes_by_user))
@@ -0,0 +1,242 @@
+import base64
+import io
+import json
+import math
+import random
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag, User
+from .generate_benchmark_data import (BENCHMARK_EMAIL_DOMAIN,
+                                      BENCHMARK_TAG_PREFIX)
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль методом ближайшего ранга."""
+    values = sorted(values)
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    """Замер основных эндпоинтов API внутри процесса.
+
+    Запросы выполняются тестовым клиентом DRF к текущей базе (SQLite
+    или локальный PostgreSQL) от имени пользователей, созданных
+    `generate_benchmark_data`. Созданные во время замера рецепты
+    удаляются в конце.
+    """
+    help = 'Замеряет задержку и число SQL-запросов основных эндпоинтов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов на каждый эндпоинт')
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Неучитываемых запросов перед замером')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Замерить только указанные эндпоинты')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--label', default='',
+            help='Метка результата, например хэш коммита')
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prepare()
+        scenarios = self.scenarios()
+        names = options['endpoints'] or list(scenarios)
+        unknown = set(names) - scenarios.keys()
+        if unknown:
+            raise CommandError(
+                'Неизвестные эндпоинты: {}. Доступны: {}'.format(
+                    ', '.join(sorted(unknown)), ', '.join(scenarios)))
+        results = {}
+        try:
+            with override_settings(
+                    ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+                for name in names:
+                    results[name] = self.measure(
+                        scenarios[name], options['requests'],
+                        options['warmup'])
+                    self.report(name, results[name])
+        finally:
+            Recipe.objects.filter(id__in=self.created).delete()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'label': options['label'],
+                    'database': connection.vendor,
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'requests': options['requests'],
+                    'seed': options['seed'],
+                    'endpoints': results,
+                }, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'))
+
+    def prepare(self):
+        self.users = list(User.objects.filter(
+            email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}').order_by('id'))
+        if not self.users:
+            raise CommandError(
+                'Нет данных для замера, выполните generate_benchmark_data')
+        self.tokens = dict(Token.objects.filter(
+            user__in=self.users).values_list('user_id', 'key'))
+        self.tag_slugs = list(Tag.objects.filter(
+            slug__startswith=BENCHMARK_TAG_PREFIX
+        ).values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.filter(
+            slug__in=self.tag_slugs).values_list('id', flat=True))
+        self.recipe_ids = list(Recipe.objects.filter(
+            author__in=self.users).values_list('id', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:1000])
+        self.ingredient_prefixes = sorted({
+            name[:3] for name in Ingredient.objects.values_list(
+                'name', flat=True)[:1000]
+        })
+        output = io.BytesIO()
+        Image.new('RGB', (64, 64), '#4a7c59').save(output, 'PNG')
+        self.image = 'data:image/png;base64,' + base64.b64encode(
+            output.getvalue()).decode()
+        self.created = []
+
+    def client(self):
+        user = self.random.choice(self.users)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.tokens[user.id]}')
+        return client, user
+
+    def recipe_data(self):
+        return {
+            'name': f'Бенчмарк {self.random.randint(1, 10 ** 6)}',
+            'text': 'Рецепт для замера производительности',
+            'cooking_time': self.random.randint(5, 120),
+            'image': self.image,
+            'tags': self.random.sample(self.tag_ids, 2),
+            'ingredients': [
+                {'id': ingredient_id,
+                 'amount': self.random.randint(1, 500)}
+                for ingredient_id in self.random.sample(
+                    self.ingredient_ids, 5)
+            ],
+        }
+
+    def scenarios(self):
+        """Эндпоинт: функция, которая готовит один запрос.
+
+        Подготовка (выбор пользователя, данные, создание рецепта для
+        изменения) не замеряется, замеряется только вызов возвращенной
+        функции.
+        """
+
+        def get(url, params=None, anonymous=False):
+            client = APIClient() if anonymous else self.client()[0]
+            return lambda: client.get(url, params)
+
+        def recipe_create():
+            client, _ = self.client()
+            data = self.recipe_data()
+
+            def request():
+                response = client.post('/api/recipes/', data, format='json')
+                if response.status_code == 201:
+                    self.created.append(response.data['id'])
+                return response
+            return request
+
+        def recipe_update():
+            client, _ = self.client()
+            data = self.recipe_data()
+            recipe_id = client.post(
+                '/api/recipes/', data, format='json').data['id']
+            self.created.append(recipe_id)
+            data.pop('image')
+            data['name'] += ' (изменен)'
+            data['ingredients'] = data['ingredients'][1:]
+            return lambda: client.patch(
+                f'/api/recipes/{recipe_id}/', data, format='json')
+
+        return {
+            'recipe_list': lambda: get(
+                '/api/recipes/', {'page': self.random.randint(1, 10)}),
+            'recipe_list_tags': lambda: get(
+                '/api/recipes/',
+                {'tags': self.random.sample(self.tag_slugs, 2)}),
+            'recipe_list_favorited': lambda: get(
+                '/api/recipes/', {'is_favorited': 1}),
+            'recipe_list_author': lambda: get(
+                '/api/recipes/',
+                {'author': self.random.choice(self.users).id}),
+            'recipe_detail': lambda: get(
+                f'/api/recipes/{self.random.choice(self.recipe_ids)}/'),
+            'subscriptions': lambda: get(
+                '/api/users/subscriptions/', {'recipes_limit': 3}),
+            'ingredient_search': lambda: get(
+                '/api/ingredients/',
+                {'name': self.random.choice(self.ingredient_prefixes)},
+                anonymous=True),
+            'cart_download': lambda: get(
+                '/api/recipes/download_shopping_cart/'),
+            'recipe_create': recipe_create,
+            'recipe_update': recipe_update,
+        }
+
+    def measure(self, scenario, requests, warmup):
+        """Задержки и число SQL-запросов для `requests` вызовов."""
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for number in range(warmup + requests):
+            request = scenario()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                duration = time.perf_counter() - start
+            if number < warmup:
+                continue
+            latencies.append(duration * 1000)
+            queries.append(len(context.captured_queries))
+            if response.status_code >= 400:
+                errors += 1
+        return {
+            'requests': requests,
+            'errors': errors,
+            'queries': {
+                'min': min(queries),
+                'max': max(queries),
+                'mean': round(sum(queries) / len(queries), 2),
+            },
+            'latency_ms': {
+                **{f'p{rank}': round(percentile(latencies, rank), 2)
+                   for rank in PERCENTILES},
+                'mean': round(sum(latencies) / len(latencies), 2),
+            },
+            'throughput_rps': round(1000 * requests / sum(latencies), 1),
+            'wall_time_s': round(time.perf_counter() - started, 2),
+        }
+
+    def report(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f'{name:<24} queries {result["queries"]["mean"]:>6} '
+            f'p50 {latency["p50"]:>8} ms  p95 {latency["p95"]:>8} ms  '
+            f'p99 {latency["p99"]:>8} ms  {result["throughput_rps"]:>7} rps'
+            + (f'  errors {result["errors"]}' if result['errors'] else '')
+        )
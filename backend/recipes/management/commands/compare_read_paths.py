@@ -0,0 +1,129 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag, User
+from users.models import Subscription
+
+
+def difference(expected, actual, path=''):
+    """Путь к первому различию двух значений JSON или None."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        if list(expected) != list(actual):
+            return f'{path or "/"}: ключи {list(expected)} != {list(actual)}'
+        for key in expected:
+            found = difference(expected[key], actual[key], f'{path}/{key}')
+            if found:
+                return found
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return (f'{path or "/"}: длина {len(expected)} != '
+                    f'{len(actual)}')
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            found = difference(left, right, f'{path}/{index}')
+            if found:
+                return found
+        return None
+    if type(expected) is not type(actual) or expected != actual:
+        return f'{path or "/"}: {expected!r} != {actual!r}'
+    return None
+
+
+class Command(BaseCommand):
+    """Контрактная проверка быстрого пути чтения.
+
+    Каждый запрос выполняется через сериализаторы (FAST_READ_PATH=False)
+    и через быстрый путь, ответы сравниваются побайтно. Проверяются
+    данные текущей базы, например созданные `generate_benchmark_data`,
+    от имени анонима и пользователей с подписками.
+    """
+    help = 'Сравнивает ответы быстрого пути чтения с ответами сериализаторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=5,
+            help='Сколько пользователей проверить, кроме анонимного')
+        parser.add_argument(
+            '--recipes', type=int, default=10,
+            help='Сколько рецептов запросить по отдельности')
+
+    def handle(self, *args, **options):
+        urls = self.urls(options['recipes'])
+        users = [None] + list(User.objects.filter(
+            pk__in=Subscription.objects.values('user')
+        ).order_by('id')[:options['users']])
+        checked, mismatches = 0, 0
+        with override_settings(
+                ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+            for user in users:
+                client = APIClient()
+                if user is not None:
+                    client.force_authenticate(user)
+                queue = list(urls)
+                while queue:
+                    url = queue.pop(0)
+                    expected, problem = self.compare(client, url)
+                    checked += 1
+                    if problem:
+                        mismatches += 1
+                        self.stdout.write(
+                            f'{user or "аноним"} {url}: {problem}')
+                    if (url in urls and isinstance(expected, dict)
+                            and expected.get('next')):
+                        queue.append(expected['next'])
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches} из {checked}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений нет, проверено ответов: {checked}'))
+
+    def urls(self, recipes):
+        recipe_ids = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True)[:recipes])
+        urls = [
+            '/api/recipes/',
+            '/api/recipes/?page=2',
+            '/api/recipes/?limit=50',
+            '/api/recipes/?cursor=',
+            '/api/recipes/?cursor=&ordering=popular',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            *[f'/api/recipes/{recipe_id}/' for recipe_id in recipe_ids],
+            '/api/recipes/0/',
+            '/api/users/subscriptions/',
+            '/api/users/subscriptions/?recipes_limit=2',
+            '/api/users/subscriptions/?cursor=&recipes_limit=1',
+            '/api/ingredients/',
+        ]
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if tags:
+            urls.append('/api/recipes/?' + '&'.join(
+                f'tags={slug}' for slug in tags))
+        recipe = Recipe.objects.order_by('id').first()
+        if recipe is not None:
+            urls.append(f'/api/recipes/?author={recipe.author_id}')
+            urls.append(f'/api/recipes/?search={recipe.name.split()[0]}')
+        ingredient = Ingredient.objects.order_by('id').first()
+        if ingredient is not None:
+            urls.append(f'/api/ingredients/?name={ingredient.name[:3]}')
+        return urls
+
+    def compare(self, client, url):
+        """Ответ сериализаторов и описание расхождения с быстрым путем."""
+        with override_settings(FAST_READ_PATH=False):
+            expected = client.get(url)
+        with override_settings(FAST_READ_PATH=True):
+            actual = client.get(url)
+        expected_data = json.loads(expected.content or 'null')
+        if expected.status_code != actual.status_code:
+            return expected_data, (
+                f'статус {expected.status_code} != {actual.status_code}')
+        if expected.content == actual.content:
+            return expected_data, None
+        return expected_data, difference(
+            expected_data, json.loads(actual.content or 'null')
+        ) or 'ответы различаются побайтно'
@@ -0,0 +1,212 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.cache import bump_version
+from api.counts import RECIPES_COUNT_VERSION
+from api.ingredients_index import INGREDIENTS_VERSION
+from api.mixins import TAGS_VERSION
+from recipes import counters, feed, search, shopping_list
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            RecipeTags, ShoppingCart, Tag, User)
+from users.models import Subscription
+
+BENCHMARK_EMAIL_DOMAIN = 'benchmark.local'
+BENCHMARK_TAG_PREFIX = 'bench-'
+BENCHMARK_PASSWORD = 'benchmark-password'
+BATCH_SIZE = 1000
+MEASUREMENT_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет', 'соус',
+    'куриный', 'овощной', 'сырный', 'грибной', 'пряный', 'домашний',
+    'летний', 'быстрый', 'томатный', 'лимонный', 'ореховый', 'рисовый',
+)
+
+
+class Command(BaseCommand):
+    """Синтетические данные для нагрузочных замеров.
+
+    Все записи создаются через bulk_create, поэтому сигналы не
+    срабатывают: списки покупок, ленты подписок, счетчики рецептов
+    и поисковый индекс пересчитываются, а версии кэшей обновляются
+    в конце. Одинаковые параметры и --seed дают одинаковый набор данных.
+    """
+    help = 'Создает воспроизводимый набор данных для бенчмарка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients', type=int, default=500,
+            help='Минимальное число ингредиентов в базе')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у каждого пользователя')
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Рецептов в корзине у каждого пользователя')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок у каждого пользователя')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные предыдущего запуска')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        if options['clear']:
+            self.clear()
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            tags = self.create_tags(options['tags'])
+            ingredients = self.ensure_ingredients(options['ingredients'])
+            recipes = self.create_recipes(
+                options['recipes'], users, tags, ingredients,
+                options['ingredients_per_recipe'])
+            self.create_links(Favorite, users, recipes, options['favorites'])
+            self.create_links(ShoppingCart, users, recipes, options['carts'])
+            self.create_subscriptions(users, options['subscriptions'])
+            shopping_list.rebuild(users)
+            feed.rebuild(users)
+            counters.reconcile()
+            search.rebuild()
+        for name in (RECIPES_COUNT_VERSION, INGREDIENTS_VERSION, TAGS_VERSION):
+            bump_version(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, тегов {len(tags)}, '
+            f'рецептов {len(recipes)}; пароль {BENCHMARK_PASSWORD}'
+        ))
+
+    def clear(self):
+        User.objects.filter(
+            email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}').delete()
+        Tag.objects.filter(slug__startswith=BENCHMARK_TAG_PREFIX).delete()
+
+    def create_users(self, count):
+        password = make_password(BENCHMARK_PASSWORD)
+        User.objects.bulk_create(
+            [User(email=f'user{number}@{BENCHMARK_EMAIL_DOMAIN}',
+                  username=f'bench_user{number}',
+                  first_name=f'Имя{number}',
+                  last_name=f'Фамилия{number}',
+                  password=password)
+             for number in range(count)],
+            batch_size=BATCH_SIZE
+        )
+        users = list(User.objects.filter(
+            email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}'
+        ).order_by('id').values_list('id', flat=True))
+        Token.objects.bulk_create(
+            [Token(key=Token.generate_key(), user_id=user_id)
+             for user_id in users],
+            batch_size=BATCH_SIZE
+        )
+        return users
+
+    def create_tags(self, count):
+        colors = self.random.sample(range(16 ** 6), count)
+        Tag.objects.bulk_create(
+            [Tag(name=f'Бенчмарк {number}',
+                 color=f'#{color:06x}',
+                 slug=f'{BENCHMARK_TAG_PREFIX}{number}')
+             for number, color in enumerate(colors)]
+        )
+        return list(Tag.objects.filter(
+            slug__startswith=BENCHMARK_TAG_PREFIX
+        ).order_by('id').values_list('id', flat=True))
+
+    def ensure_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create(
+                [Ingredient(
+                    name=f'ингредиент {number} '
+                         f'{self.random.choice(WORDS)}',
+                    measurement_unit=self.random.choice(MEASUREMENT_UNITS))
+                 for number in range(missing)],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True
+            )
+        return list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+
+    def create_image(self):
+        output = io.BytesIO()
+        Image.new('RGB', (640, 480), '#d9822b').save(output, 'PNG')
+        storage = Recipe._meta.get_field('image').storage
+        return storage.save(
+            'recipes/images/benchmark.png', ContentFile(output.getvalue()))
+
+    def create_recipes(self, count, users, tags, ingredients, per_recipe):
+        image = self.create_image()
+        now = timezone.now()
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        recipe_tags = []
+        for number in range(count):
+            recipe_tags.append(sorted(self.random.sample(
+                tags, self.random.randint(1, min(3, len(tags))))))
+        Recipe.objects.bulk_create(
+            [Recipe(author_id=self.random.choice(users),
+                    name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(self.random.choices(WORDS, k=40)),
+                    image=image,
+                    cooking_time=self.random.randint(5, 240),
+                    tag_ids=recipe_tags[number])
+             for number in range(count)],
+            batch_size=BATCH_SIZE
+        )
+        recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').only('id', 'pub_date'))
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = now - timedelta(minutes=count - number)
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date',), batch_size=BATCH_SIZE)
+        RecipeTags.objects.bulk_create(
+            [RecipeTags(recipe_id=recipe.id, tag_id=tag_id)
+             for recipe, tag_ids in zip(recipes, recipe_tags)
+             for tag_id in tag_ids],
+            batch_size=BATCH_SIZE
+        )
+        RecipeIngredients.objects.bulk_create(
+            [RecipeIngredients(recipe_id=recipe.id,
+                               ingredient_id=ingredient_id,
+                               amount=self.random.randint(1, 500))
+             for recipe in recipes
+             for ingredient_id in self.random.sample(
+                 ingredients, min(per_recipe, len(ingredients)))],
+            batch_size=BATCH_SIZE
+        )
+        return [recipe.id for recipe in recipes]
+
+    def create_links(self, model, users, recipes, per_user):
+        model.objects.bulk_create(
+            [model(user_id=user_id, recipe_id=recipe_id)
+             for user_id in users
+             for recipe_id in self.random.sample(
+                 recipes, min(per_user, len(recipes)))],
+            batch_size=BATCH_SIZE
+        )
+
+    def create_subscriptions(self, users, per_user):
+        subscriptions = []
+        for user_id in users:
+            authors = [author for author in self.random.sample(
+                users, min(per_user + 1, len(users))) if author != user_id]
+            subscriptions += [
+                Subscription(user_id=user_id, author_id=author_id)
+                for author_id in authors[:per_user]
+            ]
+        Subscription.objects.bulk_create(
+            subscriptions, batch_size=BATCH_SIZE)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Уменьшенные копии фотографий для рецептов, у которых их еще нет."""
+    help = 'Создает уменьшенные копии фотографий рецептов'
+
+    def handle(self, *args, **options):
+        count = 0
+        for recipe in Recipe.objects.exclude(image='').only(
+                'id', 'image', 'image_sizes').iterator():
+            if recipe.image_sizes.get('source') != recipe.image.name:
+                process_recipe_image(recipe.id, recipe.image.name)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {count}'))
@@ -3,6 +3,8 @@ import csv
 from django.core.management.base import BaseCommand
 from django.db import IntegrityError
 
+from api.cache import bump_version
+from api.ingredients_index import INGREDIENTS_VERSION
 from recipes.models import Ingredient
 
 
@@ -23,6 +25,7 @@ class Command(BaseCommand):
                     for row in reader
                 ]
                 Ingredient.objects.bulk_create(ingredients)
+                bump_version(INGREDIENTS_VERSION)
         except IntegrityError as error:
             print(f'Ошибка импорта: {error}')
         except FileNotFoundError:
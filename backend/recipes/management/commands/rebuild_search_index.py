@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    """Пересборка полнотекстового индекса рецептов."""
+    help = 'Пересобирает поисковый индекс рецептов'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Пересборка или проверка агрегированных списков покупок."""
+    help = 'Пересобирает списки покупок по рецептам в корзинах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохраненные списки с пересчитанными'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничить пользователями с указанными id'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['verify']:
+            shopping_list.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+            return
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): (total_amount, recipe_count)
+            for user_id, ingredient_id, total_amount, recipe_count
+            in items.values_list('user_id', 'ingredient_id',
+                                 'total_amount', 'recipe_count')
+        }
+        expected = shopping_list.expected_items(user_ids)
+        mismatches = sorted(
+            key for key in stored.keys() | expected.keys()
+            if stored.get(key) != expected.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'сохранено {stored.get((user_id, ingredient_id))}, '
+                f'ожидается {expected.get((user_id, ingredient_id))}'
+            )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {len(mismatches)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
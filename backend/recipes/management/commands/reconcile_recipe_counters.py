@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    """Сверка счетчиков избранного и списков покупок у рецептов."""
+    help = 'Пересчитывает счетчики популярности рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохраненные счетчики с пересчитанными'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            updated = counters.reconcile()
+            self.stdout.write(self.style.SUCCESS(
+                f'Счетчики пересчитаны у рецептов: {updated}'))
+            return
+        mismatches = list(counters.mismatches())
+        for row in mismatches:
+            self.stdout.write(
+                f'Рецепт {row["id"]}: ' + ', '.join(
+                    f'{field} сохранено {row[field]}, '
+                    f'ожидается {row["actual_" + field]}'
+                    for field in counters.COUNTER_FIELDS.values()
+                )
+            )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {len(mismatches)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
@@ -0,0 +1,387 @@
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag, User
+from .benchmark import PERCENTILES, percentile
+from .generate_benchmark_data import (BENCHMARK_EMAIL_DOMAIN,
+                                      BENCHMARK_TAG_PREFIX)
+
+VARIABLE_RE = re.compile(r'{{(\w+)}}')
+ID_SEGMENT_RE = re.compile(r'/\d+(?=/|$)')
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def route_name(method, path):
+    """`GET /api/recipes/{id}/`: путь без query и конкретных id."""
+    return f'{method} {ID_SEGMENT_RE.sub("/{id}", urlsplit(path).path)}'
+
+
+def load_postman(path):
+    """Запросы Postman-коллекции с учетом авторизации родительских папок."""
+    with open(path, encoding='utf-8') as file:
+        collection = json.load(file)
+    variables = {
+        variable['key']: variable['value']
+        for variable in collection.get('variable', ())
+    }
+    requests = []
+
+    def walk(items, auth):
+        for item in items:
+            item_auth = item.get('auth') or auth
+            if 'item' in item:
+                walk(item['item'], item_auth)
+                continue
+            request = item['request']
+            request_auth = request.get('auth') or item_auth
+            headers = {
+                header['key']: header['value']
+                for header in request.get('header', ())
+                if not header.get('disabled')
+            }
+            if request_auth and request_auth.get('type') == 'apikey':
+                values = {
+                    option['key']: option['value']
+                    for option in request_auth['apikey']
+                }
+                headers[values.get('key', 'Authorization')] = values['value']
+            url = request['url']
+            requests.append({
+                'method': request['method'],
+                'path': url['raw'] if isinstance(url, dict) else url,
+                'headers': headers,
+                'body': (request.get('body') or {}).get('raw') or None,
+            })
+
+    walk(collection['item'], collection.get('auth'))
+    return requests, variables
+
+
+def load_jsonl(path):
+    """Запросы из лога: по одному JSON-объекту на строку.
+
+    Строка содержит `method` и `path`, необязательные `body` (объект или
+    строка) и `auth` (true - запрос от случайного пользователя набора).
+    Подходят и записи лога `foodgram.queries` с полем `query_stats`.
+    Строки без метода и пути пропускаются.
+    """
+    requests = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entry = entry.get('query_stats', entry)
+            if not isinstance(entry, dict) or not (
+                    entry.get('method') and entry.get('path')):
+                continue
+            body = entry.get('body')
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            headers = dict(entry.get('headers') or {})
+            if entry.get('auth'):
+                headers.setdefault('Authorization', 'Token {{userToken}}')
+            requests.append({
+                'method': entry['method'].upper(),
+                'path': entry['path'],
+                'headers': headers,
+                'body': body,
+            })
+    return requests, {}
+
+
+class Dataset:
+    """Токены и id из набора `generate_benchmark_data` для подстановки
+    вместо переменных `{{...}}`."""
+
+    def __init__(self, base_url, variables, seed):
+        self.random = random.Random(seed)
+        users = list(User.objects.filter(
+            email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}'
+        ).order_by('id').values_list('id', flat=True))
+        if not users:
+            raise CommandError(
+                'Нет данных для подстановки, выполните '
+                'generate_benchmark_data')
+        self.tokens = list(Token.objects.filter(
+            user__in=users).order_by('user_id').values_list('key', flat=True))
+        self.values = {
+            'user': users,
+            'recipe': list(Recipe.objects.filter(
+                author__in=users).values_list('id', flat=True)),
+            'tag': list(Tag.objects.filter(
+                slug__startswith=BENCHMARK_TAG_PREFIX
+            ).values_list('id', flat=True)),
+            'ingredient': list(
+                Ingredient.objects.values_list('id', flat=True)[:1000]),
+        }
+        self.slugs = list(Tag.objects.filter(
+            slug__startswith=BENCHMARK_TAG_PREFIX
+        ).values_list('slug', flat=True))
+        self.variables = dict(variables, baseUrl=base_url.rstrip('/'))
+
+    def value(self, name):
+        lowered = name.lower()
+        if lowered.endswith('token'):
+            return self.random.choice(self.tokens)
+        if lowered.endswith('slug'):
+            return self.random.choice(self.slugs)
+        if lowered.endswith('amount'):
+            return str(self.random.randint(1, 500))
+        if lowered.endswith('letter') or lowered.endswith('latter'):
+            return 'с'
+        if lowered.endswith('id'):
+            for kind, ids in self.values.items():
+                if kind in lowered or (kind == 'ingredient'
+                                       and 'indredient' in lowered):
+                    return str(self.random.choice(ids))
+        return self.variables.get(name)
+
+    def substitute(self, text):
+        if text is None:
+            return None
+
+        def replace(match):
+            value = self.value(match.group(1))
+            return match.group(0) if value is None else value
+
+        return VARIABLE_RE.sub(replace, text)
+
+
+class Stats:
+    """Задержки, ошибки и гистограмма по маршрутам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route, status, latency):
+        with self.lock:
+            self.latencies[route].append(latency * 1000)
+            self.statuses[route][status] += 1
+            if not status or status >= 500:
+                self.errors[route] += 1
+
+    @staticmethod
+    def histogram(latencies):
+        buckets = {f'<={bound}': 0 for bound in HISTOGRAM_BUCKETS_MS}
+        buckets['>{}'.format(HISTOGRAM_BUCKETS_MS[-1])] = 0
+        for latency in latencies:
+            for bound in HISTOGRAM_BUCKETS_MS:
+                if latency <= bound:
+                    buckets[f'<={bound}'] += 1
+                    break
+            else:
+                buckets['>{}'.format(HISTOGRAM_BUCKETS_MS[-1])] += 1
+        return buckets
+
+    def summary(self, wall_time):
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            routes[route] = {
+                'requests': len(latencies),
+                'errors': self.errors[route],
+                'error_rate': round(self.errors[route] / len(latencies), 4),
+                'statuses': dict(self.statuses[route]),
+                'latency_ms': {
+                    **{f'p{rank}': round(percentile(latencies, rank), 2)
+                       for rank in PERCENTILES},
+                    'mean': round(sum(latencies) / len(latencies), 2),
+                },
+                'histogram_ms': self.histogram(latencies),
+                'throughput_rps': round(len(latencies) / wall_time, 2),
+            }
+        return routes
+
+
+class Command(BaseCommand):
+    """Воспроизведение записанного трафика против запущенного сервера.
+
+    Источники: Postman-коллекция (*.json) и JSONL-логи запросов.
+    Переменные `{{...}}` заменяются токенами и id из набора данных
+    `generate_benchmark_data`, ошибками считаются ответы 5xx и сбои
+    соединения. С --compare сравнивает два сохраненных прогона.
+    """
+    help = 'Воспроизводит трафик из Postman-коллекции или JSONL-лога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Запросов в секунду, 0 - без ограничения')
+        parser.add_argument(
+            '--loops', type=int, default=1,
+            help='Сколько раз повторить источники')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument(
+            '--read-only', action='store_true',
+            help='Воспроизводить только GET-запросы')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--label', default='')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument(
+            '--compare', nargs=2, metavar=('BASE', 'NEW'),
+            help='Сравнить два сохраненных прогона')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'])
+        if not options['sources']:
+            raise CommandError('Укажите Postman-коллекцию или JSONL-лог')
+        requests, variables = [], {}
+        for source in options['sources']:
+            loader = load_jsonl if source.endswith('.jsonl') else load_postman
+            loaded, source_variables = loader(source)
+            requests += loaded
+            variables.update(source_variables)
+        if options['read_only']:
+            requests = [
+                request for request in requests
+                if request['method'] in READ_METHODS
+            ]
+        if not requests:
+            raise CommandError('В источниках нет запросов')
+        dataset = Dataset(options['base_url'], variables, options['seed'])
+        stats = Stats()
+        started = time.perf_counter()
+        self.replay(
+            requests * options['loops'], dataset, stats, options)
+        wall_time = time.perf_counter() - started
+        routes = stats.summary(wall_time)
+        for route, result in routes.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{route:<48} {result["requests"]:>6} req  '
+                f'p50 {latency["p50"]:>8} ms  p95 {latency["p95"]:>8} ms  '
+                f'p99 {latency["p99"]:>8} ms  '
+                f'errors {result["error_rate"]:.2%}'
+            )
+        total = sum(result['requests'] for result in routes.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {total} запросов за {wall_time:.1f} с, '
+            f'{total / wall_time:.1f} rps'))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'label': options['label'],
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'base_url': options['base_url'],
+                    'concurrency': options['concurrency'],
+                    'rate': options['rate'],
+                    'requests': total,
+                    'wall_time_s': round(wall_time, 2),
+                    'throughput_rps': round(total / wall_time, 2),
+                    'routes': routes,
+                }, file, ensure_ascii=False, indent=2)
+
+    def replay(self, requests, dataset, stats, options):
+        interval = 1 / options['rate'] if options['rate'] else 0
+        slots = threading.BoundedSemaphore(options['concurrency'] * 2)
+        started = time.perf_counter()
+
+        def send(request):
+            try:
+                self.send(request, stats, options['timeout'])
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for number, request in enumerate(requests):
+                request = self.prepare(request, dataset, options['base_url'])
+                if interval:
+                    delay = started + number * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                slots.acquire()
+                executor.submit(send, request)
+
+    def prepare(self, request, dataset, base_url):
+        """Запрос с подставленными значениями; выполняется в основном
+        потоке, чтобы с одним --seed получались те же запросы."""
+        url = dataset.substitute(request['path'])
+        if not urlsplit(url).scheme:
+            url = base_url.rstrip('/') + url
+        body = dataset.substitute(request['body'])
+        headers = {
+            key: dataset.substitute(value)
+            for key, value in request['headers'].items()
+        }
+        if body is not None:
+            headers.setdefault('Content-Type', 'application/json')
+        return urllib.request.Request(
+            url,
+            data=body.encode() if body is not None else None,
+            headers=headers,
+            method=request['method']
+        )
+
+    def send(self, request, stats, timeout):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            status = error.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        stats.add(
+            route_name(request.get_method(), urlsplit(request.full_url).path),
+            status,
+            time.perf_counter() - start
+        )
+
+    def compare(self, base_path, new_path):
+        with open(base_path, encoding='utf-8') as file:
+            base = json.load(file)
+        with open(new_path, encoding='utf-8') as file:
+            new = json.load(file)
+
+        def change(old, current):
+            if not old:
+                return f'{"n/a":>8}'
+            return f'{(current - old) / old:>+8.1%}'
+
+        self.stdout.write(
+            f'{"":<48} {"p50":>8} {"p95":>8} {"rps":>8} {"errors":>10}')
+        for route in sorted(base['routes'].keys() | new['routes'].keys()):
+            old = base['routes'].get(route)
+            current = new['routes'].get(route)
+            if old is None or current is None:
+                self.stdout.write(
+                    f'{route:<48} только в '
+                    f'{"новом" if old is None else "базовом"} прогоне')
+                continue
+            changes = [
+                change(old['latency_ms']['p50'], current['latency_ms']['p50']),
+                change(old['latency_ms']['p95'], current['latency_ms']['p95']),
+                change(old['throughput_rps'], current['throughput_rps']),
+            ]
+            self.stdout.write(
+                f'{route:<48} ' + ' '.join(changes)
+                + f' {old["error_rate"]:>5.1%}->{current["error_rate"]:.1%}'
+            )
+        self.stdout.write(
+            f'Всего: {base["throughput_rps"]} -> {new["throughput_rps"]} rps')
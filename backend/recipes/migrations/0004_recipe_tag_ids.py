@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-18 01:16
+
+from django.db import migrations, models
+import recipes.fields
+
+
+def fill_tag_ids(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTags = apps.get_model('recipes', 'RecipeTags')
+    tag_ids = {}
+    for recipe_id, tag_id in RecipeTags.objects.values_list('recipe_id',
+                                                            'tag_id'):
+        tag_ids.setdefault(recipe_id, []).append(tag_id)
+    recipes = list(Recipe.objects.filter(pk__in=tag_ids).only('pk'))
+    for recipe in recipes:
+        recipe.tag_ids = tag_ids[recipe.pk]
+    Recipe.objects.bulk_update(recipes, ('tag_ids',), batch_size=1000)
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_tag_ids_gin ON recipes_recipe '
+            'USING gin (tag_ids)'
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_tag_ids_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_ids',
+            field=recipes.fields.IntegerArrayField(blank=True, default=list, editable=False, verbose_name='Идентификаторы тегов'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunPython(fill_tag_ids, migrations.RunPython.noop),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
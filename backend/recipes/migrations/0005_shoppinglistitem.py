@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-18 01:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list_items(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = (
+        ShoppingCart.objects
+        .filter(recipe__recipes__isnull=False)
+        .values('user_id', 'recipe__recipes__ingredient_id')
+        .annotate(total_amount=models.Sum('recipe__recipes__amount'),
+                  recipe_count=models.Count('recipe_id'))
+    )
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=row['user_id'],
+                          ingredient_id=row['recipe__recipes__ingredient_id'],
+                          total_amount=row['total_amount'],
+                          recipe_count=row['recipe_count'])
+         for row in rows],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_recipe_tag_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Общее количество')),
+                ('recipe_count', models.PositiveIntegerField(verbose_name='Количество рецептов')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'позиция списка покупок',
+                'verbose_name_plural': 'позиции списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_list_items, migrations.RunPython.noop),
+    ]
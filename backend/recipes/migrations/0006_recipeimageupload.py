@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 01:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='recipes/images/', verbose_name='Изображение')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'загруженное изображение',
+                'verbose_name_plural': 'загруженные изображения',
+            },
+        ),
+    ]
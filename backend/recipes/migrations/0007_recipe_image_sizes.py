@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 01:25
+
+from django.db import migrations, models
+import recipes.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipeimageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_sizes',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии фотографии'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, default=None, storage=recipes.images.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Фотография рецепта'),
+        ),
+        migrations.AlterField(
+            model_name='recipeimageupload',
+            name='image',
+            field=models.ImageField(storage=recipes.images.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Изображение'),
+        ),
+    ]
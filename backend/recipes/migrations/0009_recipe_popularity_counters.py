@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 01:37
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    counts = {}
+    for model_name, field in (('Favorite', 'favorites_count'),
+                              ('ShoppingCart', 'in_carts_count')):
+        model = apps.get_model('recipes', model_name)
+        counts[field] = Coalesce(models.Subquery(
+            model.objects.filter(recipe=models.OuterRef('pk')).order_by()
+            .values('recipe').annotate(count=models.Count('pk'))
+            .values('count')
+        ), 0)
+    Recipe.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_popular_idx'),
+        ),
+    ]
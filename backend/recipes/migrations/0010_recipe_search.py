@@ -0,0 +1,61 @@
+# Generated by Django 3.2 on 2026-10-18 02:05
+
+from django.db import migrations
+
+DOCUMENTS_SQL = '''
+    SELECT recipe.id, recipe.name,
+           COALESCE({aggregate}(ingredient.name, ' '), '') AS ingredients,
+           recipe.text
+    FROM recipes_recipe recipe
+    LEFT JOIN recipes_recipeingredients link ON link.recipe_id = recipe.id
+    LEFT JOIN recipes_ingredient ingredient
+        ON ingredient.id = link.ingredient_id
+    GROUP BY recipe.id, recipe.name, recipe.text
+'''
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE recipes_recipe_search ('
+            'recipe_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_document_gin '
+            'ON recipes_recipe_search USING gin (document)'
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_search (recipe_id, document) '
+            "SELECT id, setweight(to_tsvector('russian', name), 'A') "
+            "|| setweight(to_tsvector('russian', ingredients), 'B') "
+            "|| setweight(to_tsvector('russian', text), 'C') "
+            'FROM ({}) documents'.format(
+                DOCUMENTS_SQL.format(aggregate='string_agg'))
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_search '
+            'USING fts5(name, ingredients, text)'
+        )
+        schema_editor.execute(
+            'INSERT INTO recipes_recipe_search '
+            '(rowid, name, ingredients, text) '
+            + DOCUMENTS_SQL.format(aggregate='group_concat')
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
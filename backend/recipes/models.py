@@ -4,6 +4,8 @@ from django.core.validators import (MaxValueValidator, MinValueValidator,
 from django.db import models
 
 from . import constants
+from .fields import IntegerArrayField
+from .images import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -95,10 +97,17 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
         default=None,
         blank=True,
         verbose_name='Фотография рецепта'
     )
+    image_sizes = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фотографии'
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -115,9 +124,37 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    tag_ids = IntegerArrayField(
+        editable=False,
+        verbose_name='Идентификаторы тегов'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_popular_idx'
+            ),
+        )
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
 
@@ -125,6 +162,32 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeImageUpload(models.Model):
+    """Изображение, загруженное заранее для последующего рецепта."""
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Автор'
+    )
+    image = models.ImageField(
+        upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
+        verbose_name='Изображение'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата загрузки'
+    )
+
+    class Meta:
+        verbose_name = 'загруженное изображение'
+        verbose_name_plural = 'загруженные изображения'
+
+    def __str__(self):
+        return self.image.name
+
+
 class RecipeTags(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -231,3 +294,90 @@ class Favorite(ShoppingCartAndFavoriteAbstractClass):
         ]
         verbose_name = 'избранное'
         verbose_name_plural = 'избранное'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам из списка покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+    recipe_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'позиции списков покупок'
+
+    def __str__(self):
+        return f'{self.user_id} - {self.ingredient_id}: {self.total_amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора, на которого подписан пользователь, в его ленте.
+
+    Автор и дата публикации скопированы из рецепта, чтобы лента
+    читалась одним запросом по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_entry_user_author_idx'
+            ),
+        )
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи лент'
+
+    def __str__(self):
+        return f'{self.user_id} - {self.recipe_id}'
@@ -0,0 +1,170 @@
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+from .transactions import on_commit_once
+
+SEARCH_TABLE = 'recipes_recipe_search'
+SEARCH_CONFIG = 'russian'
+BATCH_SIZE = 500
+RUSSIAN_ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ов', 'ев',
+    'ей', 'ой', 'ый', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ом',
+    'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'а', 'я', 'ы', 'и', 'о',
+    'е', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+DOCUMENTS_SQL = '''
+    SELECT recipe.id, recipe.name,
+           COALESCE({aggregate}(ingredient.name, ' '), '') AS ingredients,
+           recipe.text
+    FROM recipes_recipe recipe
+    LEFT JOIN recipes_recipeingredients link ON link.recipe_id = recipe.id
+    LEFT JOIN recipes_ingredient ingredient
+        ON ingredient.id = link.ingredient_id
+    {where}
+    GROUP BY recipe.id, recipe.name, recipe.text
+'''
+POSTGRESQL_INSERT_SQL = f'''
+    INSERT INTO {SEARCH_TABLE} (recipe_id, document)
+    SELECT id,
+           setweight(to_tsvector('{SEARCH_CONFIG}', name), 'A')
+           || setweight(to_tsvector('{SEARCH_CONFIG}', ingredients), 'B')
+           || setweight(to_tsvector('{SEARCH_CONFIG}', text), 'C')
+    FROM ({{documents}}) documents
+    ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document
+'''
+SQLITE_INSERT_SQL = (
+    f'INSERT INTO {SEARCH_TABLE} (rowid, name, ingredients, text) '
+    '{documents}'
+)
+
+
+def write_documents(cursor, recipe_ids=None):
+    """Пересчитывает документы рецептов (всех, если recipe_ids=None)."""
+    where, params = '', []
+    if recipe_ids is not None:
+        where = 'WHERE recipe.id IN ({})'.format(
+            ', '.join(['%s'] * len(recipe_ids)))
+        params = list(recipe_ids)
+    if connection.vendor == 'postgresql':
+        documents = DOCUMENTS_SQL.format(aggregate='string_agg', where=where)
+        cursor.execute(
+            POSTGRESQL_INSERT_SQL.format(documents=documents), params)
+    elif connection.vendor == 'sqlite':
+        documents = DOCUMENTS_SQL.format(aggregate='group_concat', where=where)
+        cursor.execute(SQLITE_INSERT_SQL.format(documents=documents), params)
+
+
+def refresh(recipe_ids):
+    """Обновляет поисковые документы рецептов."""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    recipe_ids = sorted(set(recipe_ids))
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            if connection.vendor == 'sqlite':
+                remove(batch, cursor)
+            write_documents(cursor, batch)
+
+
+def schedule_refresh(recipe_ids):
+    """Обновляет документы после фиксации транзакции.
+
+    К этому моменту связи рецепта с ингредиентами, созданные
+    в той же транзакции через bulk_create, уже записаны. Рецепты
+    из всех вызовов в одной транзакции обновляются одним проходом.
+    """
+    on_commit_once('search-refresh', recipe_ids, refresh)
+
+
+def remove(recipe_ids, cursor=None):
+    if connection.vendor not in ('postgresql', 'sqlite') or not recipe_ids:
+        return
+    column = 'recipe_id' if connection.vendor == 'postgresql' else 'rowid'
+    sql = 'DELETE FROM {} WHERE {} IN ({})'.format(
+        SEARCH_TABLE, column, ', '.join(['%s'] * len(recipe_ids)))
+    if cursor is not None:
+        cursor.execute(sql, list(recipe_ids))
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(recipe_ids))
+
+
+@transaction.atomic
+def rebuild():
+    """Строит поисковый индекс заново для всех рецептов."""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        write_documents(cursor)
+
+
+def stem(word):
+    """Грубое отсечение окончания для поиска по префиксу в SQLite."""
+    for ending in RUSSIAN_ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def fts5_query(query):
+    """Запрос FTS5: все слова запроса как префиксы их основ."""
+    return ' '.join(
+        '"{}"*'.format(stem(word).replace('"', '""'))
+        for word in re.findall(r'\w+', query.casefold())
+    )
+
+
+def filter_recipes(queryset, query):
+    """Рецепты, подходящие под поисковый запрос.
+
+    Релевантность записывается в `search_rank`: название весит больше
+    ингредиентов, ингредиенты - больше описания. Результат упорядочен
+    по релевантности, затем по дате публикации; последующий order_by
+    (например, параметр `ordering` API) этот порядок заменяет.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        ids_sql = (
+            f'SELECT recipe_id FROM {SEARCH_TABLE} WHERE document @@ '
+            f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        )
+        rank_sql = (
+            f'SELECT ts_rank(document, '
+            f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)) "
+            f'FROM {SEARCH_TABLE} WHERE recipe_id = recipes_recipe.id'
+        )
+        params = [query]
+    elif vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.none()
+        ids_sql = (
+            f'SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s'
+        )
+        rank_sql = (
+            f'SELECT -bm25({SEARCH_TABLE}, 10.0, 4.0, 1.0) '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            'AND rowid = recipes_recipe.id'
+        )
+        params = [match]
+    else:
+        return queryset.filter(pk__in=Recipe.objects.filter(
+            Q(name__icontains=query)
+            | Q(text__icontains=query)
+            | Q(ingredients__name__icontains=query)
+        ).values('pk')).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).order_by('-pub_date', '-id')
+    return queryset.filter(pk__in=RawSQL(ids_sql, params)).annotate(
+        search_rank=RawSQL(rank_sql, params, output_field=FloatField())
+    ).order_by('-search_rank', '-pub_date', '-id')
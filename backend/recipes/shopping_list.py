@@ -0,0 +1,142 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.dispatch import Signal
+
+from .models import RecipeIngredients, ShoppingCart, ShoppingListItem, User
+
+# Отправляется после изменения списков покупок пользователей user_ids
+# (None - всех пользователей).
+lists_changed = Signal()
+
+
+def recipe_amounts(recipe_ids):
+    """Ингредиенты рецептов: {recipe_id: {ingredient_id: amount}}."""
+    amounts = defaultdict(dict)
+    for recipe_id, ingredient_id, amount in RecipeIngredients.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id', 'amount'):
+        amounts[recipe_id][ingredient_id] = amount
+    return amounts
+
+
+@transaction.atomic(savepoint=False)
+def apply_deltas(deltas, locked=False):
+    """Применяет изменения {(user_id, ingredient_id): [amount, count]}.
+
+    Строки пользователей блокируются в порядке id, поэтому параллельные
+    изменения одного списка покупок выполняются последовательно;
+    locked=True - вызывающий код уже заблокировал их в этой транзакции.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    user_ids = sorted({user_id for user_id, _ in deltas})
+    if not locked:
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas}
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for (user_id, ingredient_id), (amount, count) in deltas.items():
+        item = items.get((user_id, ingredient_id))
+        if item is None:
+            if count > 0:
+                to_create.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=amount,
+                    recipe_count=count
+                ))
+            continue
+        item.total_amount += amount
+        item.recipe_count += count
+        if item.recipe_count <= 0:
+            to_delete.append(item.pk)
+        else:
+            to_update.append(item)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(
+        to_update, ('total_amount', 'recipe_count'))
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    lists_changed.send(sender=ShoppingListItem, user_ids=user_ids)
+
+
+def add_recipes(user_id, recipe_ids, sign=1, locked=False):
+    """Учитывает рецепты, добавленные в список покупок пользователя."""
+    deltas = defaultdict(lambda: [0, 0])
+    for amounts in recipe_amounts(recipe_ids).values():
+        for ingredient_id, amount in amounts.items():
+            delta = deltas[(user_id, ingredient_id)]
+            delta[0] += sign * amount
+            delta[1] += sign
+    apply_deltas(deltas, locked=locked)
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Учитывает рецепты, удаленные из списка покупок пользователя."""
+    add_recipes(user_id, recipe_ids, sign=-1)
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта в списки покупок."""
+    change_recipes({recipe_id: (old_amounts, new_amounts)})
+
+
+def change_recipes(changes):
+    """То же для нескольких рецептов: {recipe_id: (old, new)}."""
+    changes = {recipe_id: amounts for recipe_id, amounts in changes.items()
+               if amounts[0] != amounts[1]}
+    if not changes:
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    for recipe_id, user_id in ShoppingCart.objects.filter(
+            recipe_id__in=changes).values_list('recipe_id', 'user_id'):
+        old_amounts, new_amounts = changes[recipe_id]
+        for ingredient_id in old_amounts.keys() | new_amounts.keys():
+            old = old_amounts.get(ingredient_id)
+            new = new_amounts.get(ingredient_id)
+            delta = deltas[(user_id, ingredient_id)]
+            delta[0] += (new or 0) - (old or 0)
+            delta[1] += (new is not None) - (old is not None)
+    apply_deltas(deltas)
+
+
+def expected_items(user_ids=None):
+    """Списки покупок, посчитанные заново по рецептам в корзинах."""
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+    return {
+        (row['user_id'], row['recipe__recipes__ingredient_id']): (
+            row['total_amount'], row['recipe_count'])
+        for row in carts.filter(recipe__recipes__isnull=False)
+        .values('user_id', 'recipe__recipes__ingredient_id')
+        .annotate(total_amount=Sum('recipe__recipes__amount'),
+                  recipe_count=Count('recipe_id'))
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Полностью пересобирает списки покупок."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=user_id,
+                          ingredient_id=ingredient_id,
+                          total_amount=total_amount,
+                          recipe_count=recipe_count)
+         for (user_id, ingredient_id), (total_amount, recipe_count)
+         in expected_items(user_ids).items()],
+        batch_size=1000
+    )
+    lists_changed.send(sender=ShoppingListItem, user_ids=user_ids)
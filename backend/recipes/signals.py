@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from users.models import Subscription
+from . import counters, feed, images, search, shopping_list
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                     RecipeTags, ShoppingCart, Tag, User)
+
+
+def refresh_tag_ids(recipe_ids):
+    """Пересчитывает денормализованный список тегов у рецептов.
+
+    Строки RecipeTags меняются через m2m (`recipe_tags_set`), инлайн
+    админки (`RecipeAdmin.save_related`) или каскадом при удалении тега;
+    сигналов на отдельные строки нет, чтобы удаление рецепта оставалось
+    быстрым.
+    """
+    tag_ids = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, tag_id in RecipeTags.objects.filter(
+            recipe_id__in=tag_ids).order_by('pk').values_list(
+                'recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=recipe_id, tag_ids=ids)
+         for recipe_id, ids in tag_ids.items()],
+        ['tag_ids']
+    )
+    return tag_ids
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_set(instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.tag_ids = refresh_tag_ids([instance.pk])[instance.pk]
+        return
+    if action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh_tag_ids(getattr(instance, '_cleared_recipe_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_tag_ids(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_recipes(instance, **kwargs):
+    instance._tagged_recipe_ids = list(
+        instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_tag_recipes(instance, **kwargs):
+    refresh_tag_ids(getattr(instance, '_tagged_recipe_ids', []))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    shopping_list.change_recipe(
+        instance.pk,
+        shopping_list.recipe_amounts([instance.pk])[instance.pk],
+        {}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    transaction.on_commit(lambda: images.schedule_recipe_image(instance))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.schedule(feed.fan_out, instance.pk))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.schedule(
+            feed.backfill, instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(instance, **kwargs):
+    transaction.on_commit(lambda: feed.schedule(
+        feed.remove_author, instance.user_id, instance.author_id))
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingCart)
+def remember_counted_recipe(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._counted_recipe_id = sender.objects.filter(
+            pk=instance.pk).values_list('recipe_id', flat=True).first()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_recipe_link(sender, instance, created, **kwargs):
+    if created:
+        counters.change(sender, [instance.recipe_id], 1)
+        return
+    old_recipe_id = getattr(instance, '_counted_recipe_id', None)
+    if old_recipe_id is not None and old_recipe_id != instance.recipe_id:
+        counters.change(sender, [old_recipe_id], -1)
+        counters.change(sender, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_recipe_links(instance, **kwargs):
+    """Избранное и корзина удаляются каскадом одним DELETE без сигналов,
+    поэтому рецепты запоминаются заранее.
+    """
+    instance._counted_recipe_ids = {
+        model: list(model.objects.filter(user=instance).values_list(
+            'recipe_id', flat=True))
+        for model in counters.COUNTER_FIELDS
+    }
+
+
+@receiver(post_delete, sender=User)
+def uncount_user_recipe_links(instance, **kwargs):
+    for model, recipe_ids in getattr(
+            instance, '_counted_recipe_ids', {}).items():
+        counters.change_many(model, recipe_ids, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, created, update_fields, **kwargs):
+    if created or update_fields is None or {'name', 'text'} & set(
+            update_fields):
+        search.schedule_refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    search.remove([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        search.schedule_refresh(RecipeIngredients.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
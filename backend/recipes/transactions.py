@@ -0,0 +1,44 @@
+from threading import local
+
+from django.db import transaction
+
+pending = local()
+
+
+def on_commit_once(key, items, flush, using=None):
+    """Копит items до коммита транзакции и вызывает flush(items) один раз.
+
+    Все вызовы с одним key внутри транзакции объединяются в одно
+    множество и один обработчик `on_commit`. Вне транзакции flush
+    вызывается сразу.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        flush(set(items))
+        return
+    batches = pending.__dict__.setdefault('batches', {})
+    batch_key = (connection.alias, key)
+    batch = batches.get(batch_key)
+    # Обработчик пропадает из run_on_commit после отката транзакции
+    # или точки сохранения, в которой он был зарегистрирован.
+    if batch is None or not any(
+            func is batch for _, func in connection.run_on_commit):
+        batch = Batch(batches, batch_key, flush)
+        batches[batch_key] = batch
+        transaction.on_commit(batch, using=using)
+    batch.items.update(items)
+
+
+class Batch:
+    """Накопленные до коммита элементы и их обработчик."""
+
+    def __init__(self, batches, key, flush):
+        self.batches = batches
+        self.key = key
+        self.flush = flush
+        self.items = set()
+
+    def __call__(self):
+        if self.batches.get(self.key) is self:
+            del self.batches[self.key]
+        self.flush(self.items)
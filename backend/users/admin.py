@@ -14,9 +14,10 @@ class CustomUserAdmin(UserAdmin):
         'last_name',
     )
     list_filter = (
-        'username',
-        'email'
+        'is_staff',
+        'is_active'
     )
+    search_fields = ('username', 'email', 'first_name', 'last_name')
     list_display_links = ('username',)
 
 
@@ -26,3 +27,5 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'user',
         'author'
     )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')